@@ -2,15 +2,16 @@
 # -*- coding: utf-8 -*-
 
 import sys, multiprocessing
-import qdarkstyle
-from PySide2.QtWidgets import QApplication, QSplashScreen
-from PySide2.QtGui import QFont, QPixmap
-from utils.main_ui import MainWindow
-from utils.exportTimeMark import ExportSrt
 
 
 if __name__ == '__main__':
     multiprocessing.freeze_support()
+    # 界面和spleeter/tensorflow只在主进程里导入 批量导入的子进程重新执行本文件时不用再加载一遍
+    import qdarkstyle
+    from PySide2.QtWidgets import QApplication, QSplashScreen
+    from PySide2.QtGui import QFont, QPixmap
+    from utils.main_ui import MainWindow
+    from utils.exportTimeMark import ExportSrt
     qss = ''
     try:
         with open('utils/qdark.qss', 'r') as f:
@@ -1,45 +1,69 @@
 #!/usr/bin/python3
 # -*- coding: utf-8 -*-
 
-import codecs
 from PySide2.QtWidgets import QWidget, QMainWindow, QGridLayout, QFileDialog, QToolBar,\
         QAction, QDialog, QStyle, QSlider, QLabel, QPushButton, QStackedWidget, QHBoxLayout,\
-        QLineEdit, QTableWidget, QAbstractItemView, QTableWidgetItem, QGraphicsTextItem, QMenu,\
+        QLineEdit, QTableView, QHeaderView, QAbstractItemView, QGraphicsTextItem, QMenu,\
         QGraphicsScene, QGraphicsView, QGraphicsDropShadowEffect, QComboBox, QMessageBox, QColorDialog
 from PySide2.QtMultimedia import QMediaPlayer
 from PySide2.QtMultimediaWidgets import QGraphicsVideoItem
 from PySide2.QtGui import QIcon, QKeySequence, QFont, QBrush, QColor
-from PySide2.QtCore import Qt, QTimer, QEvent, QPoint, Signal, QSizeF, QUrl
-
-
-# def calSubTime(t):
-#     '''
-#     receive str
-#     return int
-#     h:m:s.ms -> ms in total
-#     '''
-#     h = int(t[:2])
-#     m = int(t[3:5])
-#     s = int(t[6:8])
-#     t = t.replace(',', '.')
-#     ms = int(('%s00' % t.split('.')[-1])[:3])
-#     return h * 3600000 + m * 60000 + s * 1000 + ms
-
-def calSubTime(t):
+from PySide2.QtCore import Qt, QTimer, QEvent, QPoint, Signal, QSizeF, QUrl, QAbstractTableModel, QModelIndex
+from utils.subtitleParser import assTime
+
+styleKeys = ['Fontname', 'Fontsize', 'PrimaryColour', 'SecondaryColour', 'OutlineColour', 'BackColour', 'Bold', 'Italic',
+             'Underline', 'StrikeOut', 'ScaleX', 'ScaleY', 'Spacing', 'Angle', 'BorderStyle', 'Outline', 'Shadow', 'Alignment',
+             'MarginL', 'MarginR', 'MarginV', 'Encoding']
+
+
+def styleSummary(style, rows):
+    '''
+    receive {format: value} of a style, [[Start, End, Text], ...] of its events
+    return summary used by setSubDictStyle / addASSSub
+    不经过样式选择窗口 批量导入也用它
+    '''
+    summary = {key: style.get(key, '') for key in styleKeys}
+    summary['Tableview'] = rows
+    summary['Events'] = [(assTime(start), assTime(end), text) for start, end, text in rows]
+    return summary
+
+
+class assStyleModel(QAbstractTableModel):
     '''
-    receive str
-    return int
-    h:m:s.ms -> ms in total
+    样式选择窗口的表格 前面是样式参数 后面是该样式的全部事件
+    直接读parseAss的分桶结果 只有可见的行才会被取数据
     '''
-    t = t.replace(',', '.').replace('：', ':')
-    h, m, s = t.split(':')
-    if '.' in s:
-        s, ms = s.split('.')
-        ms = ('%s00' % ms)[:3]
-    else:
-        ms = 0
-    h, m, s, ms = map(int, [h, m, s, ms])
-    return h * 3600000 + m * 60000 + s * 1000 + ms
+    def __init__(self, keys, parent=None):
+        super(assStyleModel, self).__init__(parent)
+        self.keys = keys
+        self.style = None
+        self.events = []
+
+    def setStyle(self, style, events):
+        self.beginResetModel()
+        self.style = style
+        self.events = events
+        self.endResetModel()
+
+    def rowCount(self, parent=QModelIndex()):
+        if parent.isValid() or self.style is None:
+            return 0
+        return len(self.keys) + len(self.events)
+
+    def columnCount(self, parent=QModelIndex()):
+        if parent.isValid():
+            return 0
+        return 3
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid() or role != Qt.DisplayRole:
+            return None
+        row = index.row()
+        column = index.column()
+        if row < len(self.keys):
+            key = self.keys[row]
+            return (key, self.style.get(key, ''), '')[column]
+        return self.events[row - len(self.keys)][column]
 
 
 class assSelect(QDialog):
@@ -47,11 +71,9 @@ class assSelect(QDialog):
 
     def __init__(self):
         super().__init__()
-        self.subDict = {'': {'Fontname': '', 'Fontsize': '', 'PrimaryColour': '', 'SecondaryColour': '',
-                             'OutlineColour': '', 'BackColour': '', 'Bold': '', 'Italic': '', 'Underline': '', 'StrikeOut': '',
-                             'ScaleX': '', 'ScaleY': '', 'Spacing': '', 'Angle': '', 'BorderStyle': '', 'Outline': '',
-                             'Shadow': '', 'Alignment': '', 'MarginL': '', 'MarginR': '', 'MarginV': '', 'Encoding': '',
-                             'Tableview': [], 'Events': []}}
+        self.subDict = {'': styleSummary({}, [])}
+        self.styles = {}
+        self.events = {}
         self.resize(550, 800)
         self.setWindowTitle('选择要导入的ass字幕轨道')
         layout = QGridLayout()
@@ -61,8 +83,11 @@ class assSelect(QDialog):
         self.subCombox = QComboBox()
         self.subCombox.currentTextChanged.connect(self.selectChange)
         layout.addWidget(self.subCombox, 0, 2, 1, 1)
-        self.subTable = QTableWidget()
+        self.subModel = assStyleModel([key for key in self.subDict[''] if key not in ('Tableview', 'Events')])
+        self.subTable = QTableView()
+        self.subTable.setModel(self.subModel)
         self.subTable.setEditTriggers(QAbstractItemView.NoEditTriggers)
+        self.subTable.verticalHeader().setSectionResizeMode(QHeaderView.Fixed)
         layout.addWidget(self.subTable, 1, 0, 6, 3)
         self.confirm = QPushButton('导入')
         self.confirm.clicked.connect(self.sendSub)
@@ -71,95 +96,33 @@ class assSelect(QDialog):
         self.cancel.clicked.connect(self.hide)
         layout.addWidget(self.cancel, 7, 2, 1, 1)
 
-    def setDefault(self, subtitlePath='', index=0):
-        if subtitlePath:
-            self.assCheck(subtitlePath)
+    def setDefault(self, parsed=None, index=0):
+        if parsed:
+            self.assCheck(*parsed)
             self.index = index
 
     def selectChange(self, styleName):
-        self.subTable.clear()
-        self.subTable.setRowCount(len(self.subDict[styleName]) + len(self.subDict[styleName]['Tableview']) - 2)
-        self.subTable.setColumnCount(3)
+        if styleName:
+            self.subModel.setStyle(self.styles[styleName], self.events.get(styleName, []))
+        else:
+            self.subModel.setStyle(None, [])
         self.subTable.setColumnWidth(2, 270)
-        y = 0
-        for k, v in self.subDict[styleName].items():
-            if k not in ['Tableview', 'Events']:
-                self.subTable.setItem(y, 0, QTableWidgetItem(k))
-                self.subTable.setItem(y, 1, QTableWidgetItem(v))
-                y += 1
-            elif k == 'Tableview':
-                for line in v:
-                    self.subTable.setItem(y, 0, QTableWidgetItem(line[0]))
-                    self.subTable.setItem(y, 1, QTableWidgetItem(line[1]))
-                    self.subTable.setItem(y, 2, QTableWidgetItem(line[2]))
-                    y += 1
+
+    def styleSummary(self, styleName):
+        '''
+        选中某个样式时才解析它的事件 结果缓存在subDict
+        '''
+        if styleName not in self.subDict:
+            self.subDict[styleName] = styleSummary(self.styles[styleName], self.events.get(styleName, []))
+        return self.subDict[styleName]
 
     def sendSub(self):
-        self.assSummary.emit([self.index, self.subDict[self.subCombox.currentText()]])
+        self.assSummary.emit([self.index, self.styleSummary(self.subCombox.currentText())])
         self.hide()
 
-    def assCheck(self, subtitlePath):
-        self.subDict = {'': {'Fontname': '', 'Fontsize': '', 'PrimaryColour': '', 'SecondaryColour': '',
-                             'OutlineColour': '', 'BackColour': '', 'Bold': '', 'Italic': '', 'Underline': '', 'StrikeOut': '',
-                             'ScaleX': '', 'ScaleY': '', 'Spacing': '', 'Angle': '', 'BorderStyle': '', 'Outline': '',
-                             'Shadow': '', 'Alignment': '', 'MarginL': '', 'MarginR': '', 'MarginV': '', 'Encoding': '',
-                             'Tableview': [], 'Events': []}}
-        ass = codecs.open(subtitlePath, 'r', 'utf_8_sig')
-        f = ass.readlines()
-        ass.close()
-        V4Token = False
-        styleFormat = []
-        styles = []
-        eventToken = False
-        eventFormat = []
-        events = []
-        for line in f:
-            if '[V4+ Styles]' in line:
-                V4Token = True
-            elif V4Token and 'Format:' in line:
-                styleFormat = line.strip().replace(' ', '').split(':')[1].split(',')
-            elif V4Token and 'Style:' in line and styleFormat:
-                styles.append(line.strip().replace(' ', '').split(':')[1].split(','))
-            elif '[Events]' in line:
-                eventToken = True
-                V4Token = False
-            elif eventToken and 'Format:' in line:
-                eventFormat = line.strip().replace(' ', '').split(':')[1].split(',')
-            elif eventToken and 'Comment:' in line and eventFormat:
-                events.append(line.strip().replace(' ', '').split('Comment:')[1].split(','))
-            elif eventToken and 'Dialogue:' in line and eventFormat:
-                events.append(line.strip().replace(' ', '').split('Dialogue:')[1].split(','))
-
-        for cnt, _format in enumerate(eventFormat):
-            if _format == 'Start':
-                Start = cnt
-            elif _format == 'End':
-                End = cnt
-            elif _format == 'Style':
-                Style = cnt
-            elif _format == 'Text':
-                Text = cnt
-
-        for style in styles:
-            styleName = style[0]
-            self.subDict[styleName] = {'Fontname': '', 'Fontsize': '', 'PrimaryColour': '', 'SecondaryColour': '',
-                                      'OutlineColour': '', 'BackColour': '', 'Bold': '', 'Italic': '', 'Underline': '', 'StrikeOut': '',
-                                      'ScaleX': '', 'ScaleY': '', 'Spacing': '', 'Angle': '', 'BorderStyle': '', 'Outline': '',
-                                      'Shadow': '', 'Alignment': '', 'MarginL': '', 'MarginR': '', 'MarginV': '', 'Encoding': '',
-                                      'Tableview': [], 'Events': {}}
-            for cnt, _format in enumerate(styleFormat):
-                if _format in self.subDict[styleName]:
-                    self.subDict[styleName][_format] = style[cnt]
-            for line in events:
-                if styleName == line[Style]:
-                    start = calSubTime(line[Start])
-                    delta = calSubTime(line[End]) - start
-                    self.subDict[styleName]['Tableview'].append([line[Start], line[End], line[Text]])
-                    self.subDict[styleName]['Events'][start] = [delta, line[Text]]
-
+    def assCheck(self, styles, events):
+        self.subDict = {'': styleSummary({}, [])}
+        self.styles = styles
+        self.events = events
         self.subCombox.clear()
-        combox = []
-        for style in self.subDict.keys():
-            if style:
-                combox.append(style)
-        self.subCombox.addItems(combox)
+        self.subCombox.addItems([style for style in self.styles if style])
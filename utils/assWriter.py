@@ -0,0 +1,181 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+
+styleFormat = 'Format: Name, Fontname, Fontsize, PrimaryColour, SecondaryColour, OutlineColour, BackColour, Bold, Italic, Underline, StrikeOut, '\
+              'ScaleX, ScaleY, Spacing, Angle, BorderStyle, Outline, Shadow, Alignment, MarginL, MarginR, MarginV, Encoding\n'
+eventFormat = 'Format: Layer, Start, End, Style, Name, MarginL, MarginR, MarginV, Effect, Text\n'
+
+
+def ms2AssTime(ms):
+    '''
+    receive int
+    return str
+    ms -> h:mm:ss.cc
+    '''
+    cs = ms // 10
+    h, cs = divmod(cs, 360000)
+    m, cs = divmod(cs, 6000)
+    s, cs = divmod(cs, 100)
+    return '%d:%02d:%02d.%02d' % (h, m, s, cs)
+
+
+def karaokeText(start, end, text, words):
+    '''
+    receive event with word timing (offsets, cuts)
+    return text with a \\K tag before each word
+    '''
+    offsets, cuts = words
+    durations = [b - a for a, b in zip(offsets, offsets[1:])] + [end - start - offsets[-1]]
+    pieces = []
+    cut = 0
+    for duration, nextCut in zip(durations, cuts):
+        pieces.append('{\\K%s}%s' % (duration // 10, text[cut:nextCut]))
+        cut = nextCut
+    return ''.join(pieces)
+
+
+def headerText(scriptInfo, styles):
+    '''
+    receive [(key, value), ...], {subNumber: [style args]}
+    return [Script Info] [V4+ Styles] and the [Events] format line
+    '''
+    lines = ['[Script Info]\n']
+    lines += ['%s: %s\n' % (key, value) for key, value in scriptInfo]
+    lines.append('\n[V4+ Styles]\n')
+    lines.append(styleFormat)
+    lines += [styleLine(subNumber, fontArgs) for subNumber, fontArgs in styles.items()]
+    lines.append('[Events]\n')
+    lines.append(eventFormat)
+    return ''.join(lines)
+
+
+def styleLine(subNumber, fontArgs):
+    return 'Style: Subtitle_%s,%s\n\n' % (subNumber + 1, ','.join(map(str, fontArgs)))
+
+
+def dialogueTemplates(subNumber, layer, karaoke=None):
+    '''
+    每条轨道只拼一次模板 之后每条字幕只需一次%格式化
+    karaoke: None or (x, y) of \\move
+    return template of plain text, template of text already carrying \\K tags
+    '''
+    num = subNumber + 1
+    head = 'Dialogue: %s,%%s,%%s,Subtitle_%s,#%s,0,0,0,,' % (layer, num, num)
+    if not karaoke:
+        return head + '%s\n', None
+    x, y = karaoke
+    move = '\\move(%s,%s,%s,%s)\\fad(500,500)' % (x, y, x + 100, y)
+    return head + '{\\K%s' + move + '}%s\n', head + '{' + move + '}%s\n'
+
+
+def dialogueLines(events, subNumber, layer, karaoke=None):
+    '''
+    receive iterable of (start, end, text, words)
+    return list of Dialogue lines, empty texts are skipped
+    '''
+    template, wordTemplate = dialogueTemplates(subNumber, layer, karaoke)
+    if not karaoke:
+        return [template % (ms2AssTime(start), ms2AssTime(end), text) for start, end, text, _ in events if text]
+    lines = []
+    for start, end, text, words in events:
+        if not text:
+            continue
+        if words:
+            lines.append(wordTemplate % (ms2AssTime(start), ms2AssTime(end), karaokeText(start, end, text, words)))
+        else:
+            lines.append(template % (ms2AssTime(start), ms2AssTime(end), (end - start) // 10 - 100, text))
+    return lines
+
+
+def stillLine(text, subNumber, layer, karaoke=None, karaokeTime=10):
+    '''
+    预览单帧用 固定显示0~10秒
+    '''
+    num = subNumber + 1
+    head = 'Dialogue: %s,0:00:00.00,0:00:10.00,Subtitle_%s,#%s,0,0,0,,' % (layer, num, num)
+    if not karaoke:
+        return head + text + '\n'
+    x, y = karaoke
+    return head + '{\\K%s\\move(%s,%s,%s,%s)}%s\n' % (karaokeTime, x, y, x + 100, y, text)
+
+
+def writeAss(outputPath, header, lines):
+    '''
+    拼成一整块后一次写入
+    '''
+    with open(outputPath, 'w', encoding='utf_8_sig') as f:
+        f.write(header + ''.join(lines))
+
+
+class assDocument(object):
+    '''
+    预览用的ass文件 [Script Info]、每个样式、事件分别缓存
+    只重建变化的那部分 拼好后内容和上次写入的一样就不碰文件
+    '''
+    def __init__(self, outputPath):
+        self.outputPath = outputPath
+        self.scriptInfo = None
+        self.infoText = ''
+        self.styles = {}
+        self.styleLines = {}
+        self.eventText = ''
+        self.written = None
+
+    def setScriptInfo(self, scriptInfo):
+        if scriptInfo != self.scriptInfo:
+            self.scriptInfo = scriptInfo
+            self.infoText = ''.join('%s: %s\n' % (key, value) for key, value in scriptInfo)
+
+    def setStyles(self, styles):
+        for subNumber in list(self.styles):
+            if subNumber not in styles:
+                del self.styles[subNumber]
+                del self.styleLines[subNumber]
+        for subNumber, fontArgs in styles.items():
+            if self.styles.get(subNumber) != fontArgs:
+                self.styles[subNumber] = list(fontArgs)
+                self.styleLines[subNumber] = styleLine(subNumber, fontArgs)
+
+    def setEvents(self, lines):
+        self.eventText = ''.join(lines)
+
+    def text(self):
+        styleText = ''.join(self.styleLines[subNumber] for subNumber in sorted(self.styleLines))
+        return '[Script Info]\n%s\n[V4+ Styles]\n%s%s[Events]\n%s%s' % (self.infoText, styleFormat, styleText, eventFormat, self.eventText)
+
+    def flush(self):
+        '''
+        return True if the file was rewritten
+        '''
+        text = self.text()
+        if text == self.written:
+            return False
+        with open(self.outputPath, 'w', encoding='utf_8_sig') as f:
+            f.write(text)
+        self.written = text
+        return True
+
+
+if __name__ == '__main__':
+    # python -m utils.assWriter [字幕条数]  生成5条轨道的工程并计时
+    import os
+    import sys
+    import time
+    import tempfile
+    from array import array
+
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 50000
+    styles = {x: ['微软雅黑', 60, '&H00FFFFFF', '&H00000000', '&H00000000', '&H00000000', -1, 0, 0, 0,
+                  100, 100, 0, 0, 1, 2, 0, 2, 0, 0, 50, 1] for x in range(5)}
+    info = [('Title', 'bench'), ('ScriptType', 'v4.00+'), ('PlayResX', 1920), ('PlayResY', 1080)]
+    words = (array('q', [0, 300, 600]), array('q', [2, 4, 6]))
+    tracks = {x: [(i * 1000, i * 1000 + 900, '字幕%s' % i, words if x == 4 else None) for i in range(count // 5)] for x in range(5)}
+    outputPath = os.path.join(tempfile.gettempdir(), 'bench_sub.ass')
+    t = time.perf_counter()
+    lines = []
+    for subNumber, events in tracks.items():
+        lines += dialogueLines(events, subNumber, 0, (960, 900) if subNumber >= 3 else None)
+    writeAss(outputPath, headerText(info, styles), lines)
+    cost = time.perf_counter() - t
+    print('%s events in %.3fs, %d events/s' % (len(lines), cost, len(lines) / cost))
+    os.remove(outputPath)
@@ -9,6 +9,7 @@ from PySide2.QtWidgets import QGridLayout, QFileDialog, QDialog, QPushButton,\
 from PySide2.QtCore import Qt, QTime, Signal, QThread, QPoint
 from PySide2.QtGui import QFontInfo, QPixmap, QIntValidator
 from utils.separate_audio import Separate
+from utils.segmentEngine import writeSrt
 
 def ms2TimeStr(ms):
     '''
@@ -111,8 +112,9 @@ class ExportSrt(QDialog):
         self.cancel.clicked.connect(self.closeWindow)
         self.help.clicked.connect(self.dispHelp)
 
-    def setDefault(self, autoSub, videoDuration):
+    def setDefault(self, autoSub, videoDuration, fillText):
         self.autoSub = autoSub
+        self.fillText = fillText
         self.endPos.setTime(ms2QTime(videoDuration))
 
     def closeWindow(self):
@@ -144,4 +146,18 @@ class ExportSrt(QDialog):
 
         startPos = QTime2ms(self.startPos.time())
         endPos = QTime2ms(self.endPos.time())
+        srtPath = self.saveDir.text()
+        if not srtPath:
+            self.choosePath()
+            srtPath = self.saveDir.text()
+            if not srtPath:
+                return
+        maxIgnore = int(self.maxIgnore.text()) if self.maxIgnore.text().isdigit() else 0
+        maxMerge = int(self.maxMerge.text()) if self.maxMerge.text().isdigit() else 0
+        starts, ends = self.autoSub.process(startPos, endPos, self.timeMarkType.currentIndex() == 0, QTime2ms(self.offset.time()),
+                                            maxIgnore, maxMerge, self.mergeOrIgnore.currentIndex() == 0)
+        writeSrt(srtPath, starts, ends, self.fillText)
+        if self.isExportUnnumbering.isChecked():
+            writeSrt('%s_无编号.srt' % os.path.splitext(srtPath)[0], starts, ends, self.fillText, numbered=False)
+        QMessageBox.information(self, '导出时间轴', '导出完成 共%s条' % len(starts), QMessageBox.Yes)
         
\ No newline at end of file
@@ -1,22 +1,30 @@
 #!/usr/bin/python3
 # -*- coding: utf-8 -*-
 
+import os
 import subprocess
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
 from PySide2.QtWidgets import QWidget, QMainWindow, QGridLayout, QFileDialog, QToolBar,\
         QAction, QDialog, QStyle, QSlider, QLabel, QPushButton, QStackedWidget, QHBoxLayout,\
-        QLineEdit, QTableWidget, QAbstractItemView, QTableWidgetItem, QGraphicsTextItem, QMenu,\
-        QGraphicsScene, QGraphicsView, QGraphicsDropShadowEffect, QComboBox, QMessageBox, QColorDialog
+        QLineEdit, QTableView, QHeaderView, QAbstractItemView, QGraphicsTextItem, QMenu,\
+        QGraphicsScene, QGraphicsView, QGraphicsDropShadowEffect, QComboBox, QMessageBox, QColorDialog, QProgressBar
 from PySide2.QtMultimedia import QMediaPlayer
 from PySide2.QtMultimediaWidgets import QGraphicsVideoItem
-from PySide2.QtGui import QIcon, QKeySequence, QFont, QBrush, QColor
-from PySide2.QtCore import Qt, QTimer, QEvent, QPoint, Signal, QSizeF, QUrl
+from PySide2.QtGui import QIcon, QKeySequence, QFont, QIntValidator
+from PySide2.QtCore import Qt, QTimer, QEvent, QPoint, QRect, Signal, QSizeF, QUrl, QThread
 from utils.youtube_downloader import YoutubeDnld
 from utils.subtitle import exportSubtitle
 from utils.videoDecoder import VideoDecoder
 from utils.exportTimeMark import ExportSrt
 from utils.separate_audio import Separate
-from utils.assSelect import assSelect
-from utils.asyncTable import asyncTable, refillVerticalLabel
+from utils.assSelect import assSelect, styleSummary
+from utils.subtitleModel import SubtitleModel, PlayheadDelegate
+from utils.subtitleStore import SubtitleStore
+from utils.segmentEngine import SegmentEngine, rowStarts
+from utils.subtitleParser import parseCaptions, parseAss
+from utils import parseCache
+
+intervalPresets = [20, 50, 100, 200, 500, 1000]  # 间隔下拉框各档位(ms)
 
 
 def calSubTime(t):
@@ -51,20 +59,6 @@ def calSubTime2(t):
     return int(m) * 60000 + int(s) * 1000 + int(ms)
 
 
-def cnt2Time(cnt, interval):
-    '''
-    receive int
-    return str
-    count of interval times -> m:s.ms
-    '''
-    labels = []
-    for i in range(cnt):
-        m, s = divmod(i * interval, 60000)
-        s, ms = divmod(s, 1000)
-        labels.append(('%s:%02d.%03d' % (m, s, ms))[:-1])
-    return labels
-
-
 def ms2Time(ms):
     '''
     receive int
@@ -99,10 +93,144 @@ class LineEdit(QLineEdit):
 
 
 class InitProcess(QDialog):
+    cancel = Signal()
+
     def __init__(self):
         super().__init__()
         self.resize(250, 30)
-        self.setWindowTitle('正在重建字幕轨道...')
+        self.setWindowTitle('正在导入字幕...')
+        layout = QGridLayout()
+        self.setLayout(layout)
+        self.processBar = QProgressBar()
+        layout.addWidget(self.processBar, 0, 0, 1, 2)
+        self.cueLabel = QLabel()
+        layout.addWidget(self.cueLabel, 1, 0, 1, 1)
+        self.cancelButton = QPushButton('取消')
+        self.cancelButton.clicked.connect(self.cancel)
+        layout.addWidget(self.cancelButton, 1, 1, 1, 1)
+
+    def setProgress(self, percent, cues):
+        self.processBar.setValue(percent)
+        self.cueLabel.setText('已解析 %s 条' % cues)
+
+    def closeEvent(self, event):
+        self.cancel.emit()
+        event.accept()
+
+
+class subtitleImportThread(QThread):
+    '''
+    在后台读取并解析字幕文件 主线程可以继续操作
+    解析结果在done里一次性交给主线程写入轨道 取消时什么都不写
+    读取或解析出错时发出failed
+    '''
+    progress = Signal(int, int)  # 已读取字节的百分比, 已解析的字幕条数
+    done = Signal(list)
+    failed = Signal(str)
+
+    def __init__(self, subtitlePath, index, parent=None):
+        super(subtitleImportThread, self).__init__(parent)
+        self.subtitlePath = subtitlePath
+        self.index = index
+        self.cancelled = False
+
+    def readLines(self, f, events):
+        size = max(os.path.getsize(self.subtitlePath), 1)
+        read = 0
+        for cnt, line in enumerate(f):
+            if self.cancelled:
+                return
+            read += len(line)
+            if not cnt % 2000:
+                self.progress.emit(read * 100 // size, len(events))
+            yield line.decode('utf-8-sig', 'replace')
+
+    def run(self):
+        try:
+            self.parse()
+        except Exception as e:  # 线程里的异常不会传到主线程 不发信号进度窗口就一直关不掉
+            if not self.cancelled:
+                self.failed.emit('%s\n%s' % (self.subtitlePath, e))
+
+    def parse(self):
+        result = parseCache.load(self.subtitlePath)
+        if result is not None:
+            self.progress.emit(100, len(result) if isinstance(result, list) else 0)
+            self.done.emit([self.subtitlePath, self.index, result])
+            return
+        events = []
+        with open(self.subtitlePath, 'rb') as f:
+            lines = self.readLines(f, events)
+            if self.subtitlePath.endswith('.ass'):
+                result = parseAss(lines)
+            else:
+                for event in parseCaptions(lines):
+                    events.append(event)
+                result = events
+        if not self.cancelled:
+            self.progress.emit(100, len(events))
+            self.done.emit([self.subtitlePath, self.index, result])
+            parseCache.save(self.subtitlePath, result)
+
+
+class bulkImportThread(QThread):
+    '''
+    批量导入 缓存里没有的文件分给多个进程同时解析
+    全部完成后按传入顺序在done里一次性交给主线程
+    单个文件解析失败只跳过该文件 其它错误发出failed
+    '''
+    progress = Signal(int, int)  # 完成的文件百分比, 已解析的字幕条数
+    done = Signal(list)
+    failed = Signal(str)
+
+    def __init__(self, subtitlePaths, parent=None):
+        super(bulkImportThread, self).__init__(parent)
+        self.subtitlePaths = subtitlePaths
+        self.cancelled = False
+
+    def run(self):
+        try:
+            self.parse()
+        except Exception as e:
+            if not self.cancelled:
+                self.failed.emit(str(e))
+
+    def parse(self):
+        results = {}
+        cues = 0
+        for subtitlePath in self.subtitlePaths:
+            parsed = parseCache.load(subtitlePath)
+            if parsed is not None:
+                results[subtitlePath] = parsed
+                cues += len(parsed) if isinstance(parsed, list) else 0
+        misses = [subtitlePath for subtitlePath in self.subtitlePaths if subtitlePath not in results]
+        self.progress.emit(len(results) * 100 // len(self.subtitlePaths), cues)
+        if misses:
+            pool = ProcessPoolExecutor(min(len(misses), os.cpu_count() or 1))
+            pending = set()
+            try:
+                futures = {pool.submit(parseCache.parseFile, subtitlePath): subtitlePath for subtitlePath in misses}
+                pending = set(futures)
+                while pending and not self.cancelled:  # 定时醒来看一下是否取消 不用等下一个文件解析完
+                    finished, pending = wait(pending, timeout=0.2, return_when=FIRST_COMPLETED)
+                    for future in finished:
+                        subtitlePath = futures[future]
+                        try:
+                            header, sections = future.result()
+                        except Exception:
+                            results[subtitlePath] = None  # 读取或解析失败的文件跳过
+                        else:
+                            parseCache.store(subtitlePath, header, sections)
+                            results[subtitlePath] = parseCache.unpack(header, sections)
+                            cues += len(results[subtitlePath]) if header['kind'] == 'cue' else 0
+                    if finished:
+                        self.progress.emit(len(results) * 100 // len(self.subtitlePaths), cues)
+            finally:
+                for future in pending:  # 还没开始的文件不再解析
+                    future.cancel()
+                pool.shutdown(wait=not self.cancelled)  # 取消时不等正在解析的文件
+        if not self.cancelled:
+            self.done.emit([[subtitlePath, results[subtitlePath]] for subtitlePath in self.subtitlePaths])
 
 
 class Label(QLabel):
@@ -113,6 +241,7 @@ class Label(QLabel):
 
 
 class PreviewSubtitle(QDialog):
+    styleChanged = Signal()
     fontColor = '#ffffff'
     fontSize = 60
     bold = True
@@ -155,6 +284,7 @@ class PreviewSubtitle(QDialog):
 
     def getFontSize(self, index):
         self.fontSize = [x * 10 + 30 for x in range(15)][index]
+        self.styleChanged.emit()
 
     def getFontColor(self):
         color = QColorDialog.getColor()
@@ -162,6 +292,7 @@ class PreviewSubtitle(QDialog):
             self.fontColor = color.name()
             self.fontColorSelect.setText(self.fontColor)
             self.fontColorSelect.setStyleSheet('background-color:%s;color:%s' % (self.fontColor, self.colorReverse(self.fontColor)))
+            self.styleChanged.emit()
 
     def colorReverse(self, color):
         r = 255 - int(color[1:3], 16)
@@ -175,6 +306,7 @@ class PreviewSubtitle(QDialog):
             self.boldCheckBox.setStyleSheet('background-color:#3daee9')
         else:
             self.boldCheckBox.setStyleSheet('background-color:#31363b')
+        self.styleChanged.emit()
 
     def italicChange(self):
         self.italic = not self.italic
@@ -182,9 +314,68 @@ class PreviewSubtitle(QDialog):
             self.italicCheckBox.setStyleSheet('background-color:#3daee9')
         else:
             self.italicCheckBox.setStyleSheet('background-color:#31363b')
+        self.styleChanged.emit()
 
     def getShadow(self, index):
         self.shadowOffset = index
+        self.styleChanged.emit()
+
+
+class PreviewRenderer(object):
+    '''
+    视频上方的字幕预览
+    样式只在PreviewSubtitle设置改变时重建 文字只在某条轨道当前的字幕条变化时更新
+    新增的轨道第一次显示字幕时才创建对应的文字项
+    '''
+    def __init__(self, scene, playerWidget, previewSubtitle):
+        self.scene = scene
+        self.playerWidget = playerWidget
+        self.previewSubtitle = previewSubtitle
+        self.items = {}
+        self.current = {}  # 每条轨道当前显示的字幕条
+        self.previewSubtitle.styleChanged.connect(self.setStyle)
+        self.setStyle()
+
+    def setStyle(self):
+        self.font = QFont()
+        self.font.setFamily('微软雅黑')
+        self.font.setPointSize((self.previewSubtitle.fontSize + 5) / 2.5)
+        self.font.setBold(self.previewSubtitle.bold)
+        self.font.setItalic(self.previewSubtitle.italic)
+        for index in self.items:
+            self.styleItem(index)
+            self.place(index)
+
+    def styleItem(self, index):
+        item = self.items[index]
+        item.setDefaultTextColor(self.previewSubtitle.fontColor)
+        item.setFont(self.font)
+        shadow = QGraphicsDropShadowEffect()
+        shadow.setOffset(self.previewSubtitle.shadowOffset)
+        item.setGraphicsEffect(shadow)
+
+    def place(self, index):
+        item = self.items[index]
+        txtSize = item.boundingRect().size()
+        posY = self.playerWidget.size().height() - txtSize.height() * (index + 1)
+        posX = (self.playerWidget.size().width() - txtSize.width()) / 2
+        item.setPos(posX, posY)
+
+    def update(self, position, tracks):
+        for index, track in tracks.items():
+            event = track.at(position)
+            if event == self.current.get(index):
+                continue
+            self.current[index] = event
+            if index not in self.items:
+                self.items[index] = QGraphicsTextItem()
+                self.scene.addItem(self.items[index])
+                self.styleItem(index)
+            if event and event[2]:
+                self.items[index].setPlainText('#%s：' % (index + 1) + event[2])
+                self.place(index)
+            else:
+                self.items[index].setPlainText('')
 
 
 class MainWindow(QMainWindow):  # Main window
@@ -199,10 +390,17 @@ class MainWindow(QMainWindow):  # Main window
         self.duration = 60000
         self.bitrate = 2000
         self.fps = 60
-        self.autoSub = []  # 自动打轴
+        self.autoSub = SegmentEngine()  # 自动打轴
+        self.pendingAutoSub = []  # 还没写进表格的AI打轴结果 每帧合并写入一次
         self.tablePreset = ['#AI自动识别', True]
+        self.autoSubTimer = QTimer()
+        self.autoSubTimer.setSingleShot(True)
+        self.autoSubTimer.setInterval(16)
+        self.autoSubTimer.timeout.connect(self.flushAutoSubtitle)
 
         self.initProcess = InitProcess()
+        self.initProcess.cancel.connect(self.cancelImport)
+        self.subtitleImport = None
         self.assSelect = assSelect()
         self.assSelect.assSummary.connect(self.addASSSub)
         self.previewSubtitle = PreviewSubtitle()
@@ -247,6 +445,7 @@ class MainWindow(QMainWindow):  # Main window
         self.subSelectedTxt = ''
         self.subReplayTime = 1
         self.clipBoard = []
+        self.labelSecond = -1
         self.grabKeyboard()
         self.show()
 
@@ -261,242 +460,159 @@ class MainWindow(QMainWindow):  # Main window
         self.player.setVideoOutput(self.playerWidget)
         self.view.installEventFilter(self)
         self.view.show()
-        self.srtTextItemDict = {0: QGraphicsTextItem(), 1: QGraphicsTextItem(), 2: QGraphicsTextItem(), 3: QGraphicsTextItem(), 4: QGraphicsTextItem()}
-        for _, srtTextItem in self.srtTextItemDict.items():
-            self.scene.addItem(srtTextItem)
 
     def setSubtitle(self):
-        self.subtitleDict = {x: {-1: [20, '']} for x in range(5)}
+        self.subtitleStore = SubtitleStore(5)
+        self.previewRenderer = PreviewRenderer(self.scene, self.playerWidget, self.previewSubtitle)
         self.subTimer = QTimer()
         self.subTimer.setInterval(100)
-        self.subtitle = QTableWidget()
+        self.subtitleModel = SubtitleModel(self.subtitleStore, self.globalInterval, self.duration)
+        self.subtitle = QTableView()
+        self.subtitle.setModel(self.subtitleModel)
+        self.playheadDelegate = PlayheadDelegate(self.subtitle)
+        self.subtitle.setItemDelegate(self.playheadDelegate)
         self.subtitle.setAutoScroll(False)
-        self.subtitle.setEditTriggers(QAbstractItemView.NoEditTriggers)
         self.mainLayout.addWidget(self.subtitle, 0, 8, 10, 12)
-        self.subtitle.setColumnCount(5)
         self.subtitle.selectRow(0)
-        self.subtitle.setHorizontalHeaderLabels(['%s' % (i + 1) for i in range(5)])
-#         self.subtitle.setVerticalHeaderLabels([cnt2Time(i, self.globalInterval) for i in range(self.subtitle.rowCount())])
-        for index in range(5):
+        for index in range(self.subtitleModel.columnCount()):
             self.subtitle.setColumnWidth(index, 130)
         self.subtitle.setHorizontalScrollMode(QAbstractItemView.ScrollPerPixel)
         self.subtitle.setEditTriggers(QAbstractItemView.DoubleClicked)
         self.subtitle.horizontalHeader().sectionClicked.connect(self.addSubtitle)
         self.subtitle.doubleClicked.connect(self.releaseKeyboard)
-        self.subtitle.cellChanged.connect(self.subEdit)
         self.subtitle.verticalHeader().sectionClicked.connect(self.subHeaderClick)
         self.subtitle.verticalHeader().setFixedWidth(70)
+        self.subtitle.verticalHeader().setSectionResizeMode(QHeaderView.Fixed)  # 固定行高 缩放时不用逐行计算高度
+        self.subtitle.viewport().installEventFilter(self)
         self.subtitle.setContextMenuPolicy(Qt.CustomContextMenu)
         self.subtitle.customContextMenuRequested.connect(self.popTableMenu)
-        self.refill = refillVerticalLabel(0, self.globalInterval, self.subtitle)
-        self.refill.start()
-#         self.refillTimer = QTimer()
-#         self.refillTimer.setInterval(100)
-#         self.refillTimer.timeout.connect(self.refillVertical)
-#         self.refillTimer.start()
-        self.oldVerticalScrollValue = 0
         self.initSubtitle()
 
-#     def refillVertical(self):
-#         scrollValue = self.subtitle.verticalScrollBar().value()
-#         if scrollValue != self.oldVerticalScrollValue:
-#             self.oldVerticalScrollValue = scrollValue
-#             refillToken = False
-#             for y in range(scrollValue - 1, scrollValue + 60):
-#                 if not self.subtitle.verticalHeaderItem(y):
-#                     refillToken = True
-#                     break
-#             if refillToken:
-#                 if self.refill.isRunning:
-#                     self.refill.terminate()
-#                     self.refill.quit()
-#                     self.refill.wait()
-#                 self.refill = refillVerticalLabel(scrollValue, self.globalInterval, self.subtitle)
-#                 self.refill.start()
-
     def initSubtitle(self):
-        self.initProcess.show()
-        self.subtitle.cellChanged.disconnect(self.subEdit)
-        for x in range(self.subtitle.columnCount()):
-            for y in range(self.subtitle.rowCount()):
-                if self.subtitle.rowSpan(y, x) > 1:
-                    self.subtitle.setSpan(y, x, 1, 1)
-        self.subtitle.setRowCount(self.duration // self.globalInterval + 1)
-        for x in range(self.subtitle.columnCount()):
-            for y in range(self.subtitle.rowCount()):
-                self.subtitle.setItem(y, x, QTableWidgetItem(''))
-                self.subtitle.item(y, x).setBackground(QBrush(QColor('#232629')))
-        for t in self.autoSub:
-            start, end = t
-            startRow = start // self.globalInterval
-            endRow = end // self.globalInterval
-            if self.tablePreset[1]:
-                self.subtitle.setItem(startRow, 0, QTableWidgetItem(self.tablePreset[0]))
-                try:
-                    self.subtitle.item(startRow, 0).setBackground(QBrush(QColor('#35545d')))
-                except:
-                    pass
-                self.subtitle.setSpan(startRow, 0, endRow - startRow, 1)
-                if self.tablePreset[0]:
-                    self.subtitleDict[0][start] = [end - start, self.tablePreset[0]]
-            else:
-                for y in range(startRow, endRow):
-                    self.subtitle.setItem(y, 0, QTableWidgetItem(self.tablePreset[0]))
-                    try:
-                        self.subtitle.item(y, 0).setBackground(QBrush(QColor('#35545d')))
-                    except:
-                        pass
-                    if self.tablePreset[0]:
-                        self.subtitleDict[0][y * self.globalInterval] = [self.globalInterval, self.tablePreset[0]]
-        self.subtitle.setVerticalHeaderLabels(cnt2Time(self.subtitle.rowCount(), self.globalInterval))
-        self.subtitle.cellChanged.connect(self.subEdit)
-        self.initProcess.hide()
+        self.subtitleModel.setInterval(self.globalInterval)
+        self.subtitleModel.setDuration(self.duration)
+
+    def addTrack(self):
+        '''
+        新增一条空字幕轨道 只插入一列 不重建表格
+        '''
+        index = self.subtitleModel.addTrack()
+        self.subtitle.setColumnWidth(index, 130)
+        self.subEditComBox.addItem('字幕 ' + str(index + 1))
+        return index
+
+    def setDurationByEvents(self):
+        '''
+        导入的字幕比视频长时 延长表格
+        '''
+        maxEnd = self.subtitleStore.lastEnd()
+        if maxEnd > self.duration:
+            self.duration = maxEnd
+        self.subtitleModel.setDuration(self.duration)
 
     def addSubtitle(self, index):
+        if self.subtitleImport and self.subtitleImport.isRunning():
+            self.initProcess.show()
+            return
         subtitlePath = QFileDialog.getOpenFileName(self, "请选择字幕", None, "字幕文件 (*.srt *.vtt *.ass)")[0]
         if subtitlePath:
-            subData = {}
+            self.subtitleImport = subtitleImportThread(subtitlePath, index)
+            self.subtitleImport.progress.connect(self.initProcess.setProgress)
+            self.subtitleImport.done.connect(self.importFinish)
+            self.subtitleImport.failed.connect(self.importFailed)
+            self.initProcess.setProgress(0, 0)
+            self.initProcess.show()
+            self.subtitleImport.start()
+
+    def bulkImportFiles(self):
+        subtitlePaths = QFileDialog.getOpenFileNames(self, "请选择字幕", None, "字幕文件 (*.srt *.vtt *.ass)")[0]
+        if subtitlePaths:
+            self.startBulkImport(sorted(subtitlePaths))
+
+    def bulkImportFolder(self):
+        folder = QFileDialog.getExistingDirectory(self, "请选择字幕文件夹")
+        if folder:
+            subtitlePaths = [os.path.join(folder, name) for name in sorted(os.listdir(folder)) if name.lower().endswith(('.srt', '.vtt', '.ass'))]
+            if subtitlePaths:
+                self.startBulkImport(subtitlePaths)
+
+    def startBulkImport(self, subtitlePaths):
+        if self.subtitleImport and self.subtitleImport.isRunning():
+            self.initProcess.show()
+            return
+        self.subtitleImport = bulkImportThread(subtitlePaths)
+        self.subtitleImport.progress.connect(self.initProcess.setProgress)
+        self.subtitleImport.done.connect(self.bulkImportFinish)
+        self.subtitleImport.failed.connect(self.importFailed)
+        self.initProcess.setProgress(0, 0)
+        self.initProcess.show()
+        self.subtitleImport.start()
+
+    def bulkImportFinish(self, results):
+        '''
+        按文件顺序依次放进空轨道 不够就新增轨道 ass文件里每个有字幕的样式各占一条轨道
+        所有轨道写完后只刷新一次表格
+        '''
+        self.initProcess.hide()
+        freeTracks = [index for index, track in self.subtitleStore.items() if not len(track)]
+        freeTracks.reverse()
+        for subtitlePath, parsed in results:
+            if not parsed:
+                continue
             if subtitlePath.endswith('.ass'):
-                self.assSelect.setDefault(subtitlePath, index)
-                self.assSelect.hide()
-                self.assSelect.show()
+                styles, events = parsed
+                groups = []
+                for styleName in styles:
+                    if events.get(styleName):
+                        try:
+                            groups.append(styleSummary(styles[styleName], events[styleName]))
+                        except ValueError:  # 时间格式读不了的样式跳过 不影响其它轨道
+                            continue
             else:
-                self.initProcess.show()
-                self.subtitle.cellChanged.disconnect(self.subEdit)
-                with open(subtitlePath, 'r', encoding='utf-8') as f:
-                    f = f.readlines()
-                subText = ''
-                YoutubeAutoSub = False
-                for l in f:
-                    if '<c>' in l:
-                        YoutubeAutoSub = True
-                        break
-                for cnt, l in enumerate(f):
-                    if '<c>' in l:
-                        lineData = l.split('c>')
-                        if len(lineData) > 3:
-                            subText, start, _ = lineData[0].split('<')
-                            start = calSubTime(start[:-1]) // 20 * 20
-                            if start not in self.subtitleDict[index]:
-                                end = calSubTime(lineData[-3][1:-2]) // 20 * 20
-                                for i in range(len(lineData) // 2):
-                                    subText += lineData[i * 2 + 1][:-2]
-                                subData[start] = [end - start, subText]
-                        else:
-                            subText, start, _ = lineData[0].split('<')
-                            start = calSubTime(start[:-1]) // 20 * 20
-                            if start not in self.subtitleDict[index]:
-                                subText += lineData[1][:-2]
-                                subData[start] = [self.globalInterval, subText]
-                    elif '-->' in l and f[cnt + 2].strip() and '<c>' not in f[cnt + 2]:
-                        subText = f[cnt + 2][:-1]
-                        start, end = l.strip().replace(' ', '').split('-->')
-                        start = calSubTime(start) // 20 * 20
-                        if start not in self.subtitleDict[index]:
-                            if 'al' in end:  # align
-                                end = end.split('al')[0]
-                            end = calSubTime(end) // 20 * 20
-                            subData[start] = [end - start, subText]
-                    if '-->' in l and f[cnt + 1].strip() and not YoutubeAutoSub:
-                        start, end = l.strip().replace(' ', '').split('-->')
-                        start = calSubTime(start) // 20 * 20
-                        if start not in self.subtitleDict[index]:
-                            end = calSubTime(end) // 20 * 20
-                            delta = end - start
-                            if delta > 10:
-                                if '<b>' in f[cnt + 1]:
-                                    subData[start] = [delta, f[cnt + 1].split('<b>')[1].split('<')[0]]
-                                else:
-                                    subData[start] = [delta, f[cnt + 1][:-1]]
-                self.subtitleDict[index].update(subData)
-                maxRow = 0
-                for _, v in self.subtitleDict.items():
-                    startMax = max(v.keys())
-                    rowCount = (startMax + v[startMax][0]) // self.globalInterval
-                    if rowCount > maxRow:
-                        maxRow = rowCount
-                if maxRow < self.duration // self.globalInterval + 1:
-                    maxRow = self.duration // self.globalInterval
-                else:
-                    self.duration = maxRow * self.globalInterval
-                self.subtitle.setRowCount(maxRow)
-#                 self.subtitle.setVerticalHeaderLabels([cnt2Time(i, self.globalInterval) for i in range(self.subtitle.rowCount())])
-                for start, rowData in subData.items():
-                    startRow = start // self.globalInterval
-                    endRow = startRow + rowData[0] // self.globalInterval
-                    for row in range(startRow, endRow):
-                        self.subtitle.setItem(row, index, QTableWidgetItem(rowData[1]))
-                        self.subtitle.item(row, index).setBackground(QBrush(QColor('#35545d')))
-                    if endRow - startRow > 1:
-                        self.subtitle.setSpan(startRow, index, endRow - startRow, 1)
-                self.subtitle.cellChanged.connect(self.subEdit)
-                self.initProcess.hide()
+                groups = [{'Events': parsed}]
+            for group in groups:
+                index = freeTracks.pop() if freeTracks else self.addTrack()
+                if 'Fontname' in group:
+                    try:
+                        self.videoDecoder.setSubDictStyle([index, group])
+                    except (ValueError, KeyError):
+                        pass  # 样式参数读不了时只导入字幕 保留默认样式
+                self.subtitleStore[index].addMany(group['Events'])
+        self.setDurationByEvents()
+        self.subtitleModel.refresh()
+
+    def importFailed(self, message):
+        self.initProcess.hide()
+        QMessageBox.warning(self, '导入字幕', '导入失败\n%s' % message, QMessageBox.Yes)
+
+    def cancelImport(self):
+        if self.subtitleImport:
+            self.subtitleImport.cancelled = True
+        self.initProcess.hide()
+
+    def importFinish(self, result):
+        subtitlePath, index, parsed = result
+        self.initProcess.hide()
+        if subtitlePath.endswith('.ass'):
+            self.assSelect.setDefault(parsed, index)
+            self.assSelect.hide()
+            self.assSelect.show()
+        else:
+            track = self.subtitleStore[index]
+            track.addMany([event for event in parsed if event[0] not in track])  # 已有的字幕不覆盖
+            self.setDurationByEvents()
+            self.subtitleModel.refresh(index)
 
     def addASSSub(self, assSummary):
         index = assSummary[0]
         assDict = assSummary[1]
-        self.initProcess.show()
-        self.subtitle.cellChanged.disconnect(self.subEdit)
         self.videoDecoder.setSubDictStyle(assSummary)
-        subData = assDict['Events']
-        self.subtitleDict[index].update(subData)
-        maxRow = 0
-        for _, v in self.subtitleDict.items():
-            startMax = max(v.keys())
-            rowCount = (startMax + v[startMax][0]) // self.globalInterval
-            if rowCount > maxRow:
-                maxRow = rowCount
-        if maxRow < self.duration // self.globalInterval + 1:
-            maxRow = self.duration // self.globalInterval
-        else:
-            self.duration = maxRow * self.globalInterval
-        self.subtitle.setRowCount(maxRow)
-#         self.subtitle.setVerticalHeaderLabels([cnt2Time(i, self.globalInterval) for i in range(self.subtitle.rowCount())])
-        for start, rowData in subData.items():
-            startRow = start // self.globalInterval
-            endRow = startRow + rowData[0] // self.globalInterval
-            for row in range(startRow, endRow):
-                self.subtitle.setItem(row, index, QTableWidgetItem(rowData[1]))
-                self.subtitle.item(row, index).setBackground(QBrush(QColor('#35545d')))
-            if endRow - startRow > 1:
-                self.subtitle.setSpan(startRow, index, endRow - startRow, 1)
-        self.subtitle.cellChanged.connect(self.subEdit)
-        self.initProcess.hide()
+        self.subtitleStore[index].addMany(assDict['Events'])
+        self.setDurationByEvents()
+        self.subtitleModel.refresh(index)
 
     def subTimeOut(self):
-        fontColor = self.previewSubtitle.fontColor
-        fontSize = (self.previewSubtitle.fontSize + 5) / 2.5
-        fontBold = self.previewSubtitle.bold
-        fontItalic = self.previewSubtitle.italic
-        fontShadowOffset = self.previewSubtitle.shadowOffset
-        for _, srtTextItem in self.srtTextItemDict.items():
-            srtTextItem.setDefaultTextColor(fontColor)
-            font = QFont()
-            font.setFamily("微软雅黑")
-            font.setPointSize(fontSize)
-            font.setBold(fontBold)
-            font.setItalic(fontItalic)
-            srtTextItem.setFont(font)
-            srtTextShadow = QGraphicsDropShadowEffect()
-            srtTextShadow.setOffset(fontShadowOffset)
-            srtTextItem.setGraphicsEffect(srtTextShadow)
-        try:
-            selected = self.subtitle.selectionModel().selection().indexes()
-            for x, i in enumerate(selected):
-                if self.subtitle.item(i.row(), x):
-                    txt = self.subtitle.item(i.row(), x).text()
-                    if txt:
-                        self.srtTextItemDict[x].setPlainText('#%s：' % (x + 1) + txt)
-                        txtSize = self.srtTextItemDict[x].boundingRect().size()
-                        posY = self.playerWidget.size().height() - txtSize.height() * (x + 1)
-                        posX = (self.playerWidget.size().width() - txtSize.width()) / 2
-                        self.srtTextItemDict[x].setPos(posX, posY)
-                    else:
-                        self.srtTextItemDict[x].setPlainText('')
-                else:
-                    self.srtTextItemDict[x].setPlainText('')
-        except:
-            pass
+        self.previewRenderer.update(self.player.position(), self.subtitleStore)
 
     def subHeaderClick(self, index):
         if self.player.duration():
@@ -505,25 +621,7 @@ class MainWindow(QMainWindow):  # Main window
             self.videoSlider.setValue(position * 1000 // self.player.duration())
             self.setTimeLabel(position)
 
-    def subEdit(self, row, index):
-        repeat = self.subtitle.rowSpan(row, index)
-        firstText = self.subtitle.item(row, index).text()
-        self.setSubtitleDict(row, index, repeat, firstText)
-        self.subtitle.cellChanged.disconnect(self.subEdit)
-        for cnt in range(repeat):
-            self.subtitle.setItem(row + cnt, index, QTableWidgetItem(firstText))
-            if self.subtitle.item(row + cnt, index).text():
-                self.subtitle.item(row, index).setBackground(QBrush(QColor('#35545d')))
-            else:
-                self.subtitle.item(row, index).setBackground(QBrush(QColor('#232629')))
-        self.subtitle.cellChanged.connect(self.subEdit)
-
-    def setSubtitleDict(self, row, index, num, text):
-        if text:
-            self.subtitleDict[index][row * self.globalInterval] = [num * self.globalInterval, text]
-
     def popTableMenu(self, pos):
-        self.subtitle.cellChanged.disconnect(self.subEdit)
         pos = QPoint(pos.x() + 55, pos.y() + 30)
         menu = QMenu()
         setSpan = menu.addAction('合并')
@@ -533,79 +631,58 @@ class MainWindow(QMainWindow):  # Main window
         delete = menu.addAction('删除')
         addSub = menu.addAction('导入字幕')
         cutSub = menu.addAction('裁剪字幕')
+        addTrack = menu.addAction('新增轨道')
         action = menu.exec_(self.subtitle.mapToGlobal(pos))
+        if action == addTrack:
+            self.addTrack()
+            return
         selected = self.subtitle.selectionModel().selection().indexes()
-        yList = [selected[0].row(), selected[-1].row()]
+        if not selected:
+            return
+        yList = [min(i.row() for i in selected), max(i.row() for i in selected)]
         xSet = set()
         for i in range(len(selected)):
             xSet.add(selected[i].column())
+        start = yList[0] * self.globalInterval
+        end = (yList[1] + 1) * self.globalInterval
         if action == copy:
-            for x in xSet:
-                self.clipBoard = []
-                for y in range(yList[0], yList[1] + 1):
-                    if self.subtitle.item(y, x):
-                        self.clipBoard.append(self.subtitle.item(y, x).text())
-                    else:
-                        self.clipBoard.append('')
-                break
+            x = min(xSet)
+            self.clipBoard = []
+            for y in range(yList[0], yList[1] + 1):
+                self.clipBoard.append(self.subtitleModel.cellText(y, x))
         elif action == paste:
             for x in xSet:
+                pasteEnd = start + len(self.clipBoard) * self.globalInterval
+                self.subtitleStore[x].removeBetween(start, pasteEnd)
                 for cnt, text in enumerate(self.clipBoard):
-                    self.subtitle.setSpan(yList[0] + cnt, x, 1, 1)
-                    self.subtitle.setItem(yList[0] + cnt, x, QTableWidgetItem(text))
                     if text:
-                        self.subtitle.item(yList[0] + cnt, x).setBackground(QBrush(QColor('#35545d')))
-                        self.subtitleDict[x][(yList[0] + cnt) * self.globalInterval] = [self.globalInterval, text]
-                    else:
-                        self.subtitle.item(yList[0] + cnt, x).setBackground(QBrush(QColor('#232629')))
+                        pasteStart = start + cnt * self.globalInterval
+                        self.subtitleStore[x].add(pasteStart, pasteStart + self.globalInterval, text)
+                self.subtitleModel.refresh(x, start, pasteEnd)
         elif action == delete:
             for x in xSet:
-                for y in range(yList[0], yList[1] + 1):
-                    if self.subtitle.item(y, x):
-                        self.subtitle.setSpan(y, x, 1, 1)
-                        if self.subtitle.item(y, x).text():
-                            self.subtitle.setItem(y, x, QTableWidgetItem(''))
-                            self.subtitle.item(y, x).setBackground(QBrush(QColor('#232629')))
-                        if y * self.globalInterval in self.subtitleDict[x]:
-                            del self.subtitleDict[x][y * self.globalInterval]
+                for t, tEnd, _ in self.subtitleStore[x].removeBetween(start, end):
+                    self.subtitleModel.refresh(x, t, tEnd)
         elif action == setSpan:
             for x in xSet:
-                if not self.subtitle.item(yList[0], x):
-                    firstItem = ''
-                else:
-                    firstItem = self.subtitle.item(yList[0], x).text()
-                for y in range(yList[0], yList[1] + 1):
-                    if self.subtitle.rowSpan(y, x) > 1:
-                        self.subtitle.setSpan(y, x, 1, 1)
-                    self.subtitle.setItem(y, x, QTableWidgetItem(firstItem))
-                    self.subtitle.item(y, x).setBackground(QBrush(QColor('#35545d')))
-                    if y * self.globalInterval in self.subtitleDict[x]:
-                        del self.subtitleDict[x][y * self.globalInterval]
-            for x in xSet:
-                self.subtitle.setSpan(yList[0], x, yList[1] - yList[0] + 1, 1)
-            self.setSubtitleDict(yList[0], x, yList[1] - yList[0] + 1, firstItem)
+                firstItem = self.subtitleModel.cellText(yList[0], x)
+                removed = self.subtitleStore[x].removeBetween(start, end)
+                if firstItem:
+                    self.subtitleStore[x].add(start, end, firstItem)
+                self.subtitleModel.refresh(x, min([start] + [t for t, _, _ in removed]), max([end] + [tEnd for _, tEnd, _ in removed]))
         elif action == clrSpan:
             for x in xSet:
-                for cnt, y in enumerate(range(yList[0], yList[1] + 1)):
-                    repeat = self.subtitle.rowSpan(y, x)
-                    if repeat > 1:
-                        self.subtitle.setSpan(y, x, 1, 1)
-                        for repeatY in range(repeat):
-                            newY = y + repeatY
-                            if self.subtitle.item(newY, x):
-                                if self.subtitle.item(newY, x).text():
-                                    self.subtitleDict[x][newY * self.globalInterval] = [self.globalInterval, self.subtitle.item(newY, x).text()]
+                for t, tEnd, text in self.subtitleStore[x].removeBetween(start, end):
+                    startRow = max(t, 0) // self.globalInterval
+                    endRow = max((tEnd - 1) // self.globalInterval, startRow)
+                    self.subtitleStore[x].addMany((y * self.globalInterval, (y + 1) * self.globalInterval, text) for y in range(startRow, endRow + 1))
+                    self.subtitleModel.refresh(x, t, tEnd)
         elif action == addSub:
-            self.subtitle.cellChanged.connect(self.subEdit)
             for x in xSet:
                 self.addSubtitle(x)
-            self.subtitle.cellChanged.disconnect(self.subEdit)
         elif action == cutSub:
             for x in xSet:
-                start = yList[0] * self.globalInterval
-                end = yList[1] * self.globalInterval
-                self.exportSubWindow(start, end, x + 1)
-        self.subtitle.cellChanged.connect(self.subEdit)
+                self.exportSubWindow(start, yList[1] * self.globalInterval, x + 1)
 
     def setToolBar(self):
         '''
@@ -617,6 +694,10 @@ class MainWindow(QMainWindow):  # Main window
         fileMenu = self.menuBar().addMenu('&文件')
         openAction = QAction(QIcon.fromTheme('document-open'), '&打开...', self, shortcut=QKeySequence.Open, triggered=self.open)
         fileMenu.addAction(openAction)
+        bulkImportAction = QAction(QIcon.fromTheme('document-open'), '&批量导入字幕...', self, triggered=self.bulkImportFiles)
+        fileMenu.addAction(bulkImportAction)
+        folderImportAction = QAction(QIcon.fromTheme('document-open'), '&导入字幕文件夹...', self, triggered=self.bulkImportFolder)
+        fileMenu.addAction(folderImportAction)
         downloadAction = QAction(QIcon.fromTheme('document-open'), '&Youtube下载器', self, triggered=self.popDnld)
         fileMenu.addAction(downloadAction)
         exitAction = QAction(QIcon.fromTheme('application-exit'), '&退出', self, shortcut='Ctrl+Q', triggered=self.close)
@@ -635,6 +716,8 @@ class MainWindow(QMainWindow):  # Main window
         playMenu.addAction(separateAction)
         previewAction = QAction(QIcon.fromTheme('document-open'), '&设置预览字幕', self, triggered=self.popPreview)
         playMenu.addAction(previewAction)
+        addTrackAction = QAction(QIcon.fromTheme('document-open'), '&新增字幕轨道', self, triggered=self.addTrack)
+        playMenu.addAction(addTrackAction)
 
         decodeMenu = self.menuBar().addMenu('&输出')
         decodeAction = QAction(QIcon.fromTheme('document-open'), '&输出字幕及视频', self, triggered=self.decode)
@@ -682,11 +765,11 @@ class MainWindow(QMainWindow):  # Main window
         self.globalIntervalComBox = QComboBox()
         self.globalIntervalComBox.addItems(['间隔 20ms', '间隔 50ms', '间隔 100ms', '间隔 200ms', '间隔 500ms', '间隔 1s'])
         self.globalIntervalComBox.setCurrentIndex(3)
-        self.globalIntervalComBox.currentIndexChanged.connect(self.setGlobalInterval)
+        self.globalIntervalComBox.activated.connect(self.setGlobalInterval)  # 滚轮缩放后再选同一档也能切回去
         toolBar.addWidget(self.globalIntervalComBox)
         toolBar.addWidget(QLabel('  '))
         self.subEditComBox = QComboBox()
-        for i in range(self.subtitle.columnCount()):
+        for i in range(self.subtitleModel.columnCount()):
             self.subEditComBox.addItem('字幕 ' + str(i + 1))
         toolBar.addWidget(self.subEditComBox)
         toolBar.addWidget(QLabel('  '))
@@ -698,6 +781,12 @@ class MainWindow(QMainWindow):  # Main window
         moveAfterward.setFixedWidth(50)
         toolBar.addWidget(moveAfterward)
         toolBar.addWidget(QLabel('  '))
+        self.nudgeEdit = QLineEdit()  # 平移步长(ms) 留空则按当前间隔平移
+        self.nudgeEdit.setPlaceholderText('步长ms')
+        self.nudgeEdit.setValidator(QIntValidator(1, 3600000))
+        self.nudgeEdit.setFixedWidth(60)
+        toolBar.addWidget(self.nudgeEdit)
+        toolBar.addWidget(QLabel('  '))
         clearSub = QPushButton('清空')
         clearSub.setFixedWidth(50)
         toolBar.addWidget(clearSub)
@@ -711,85 +800,78 @@ class MainWindow(QMainWindow):  # Main window
         outputSub.clicked.connect(self.exportSubWindow)
 
     def setGlobalInterval(self, index):
+        if index >= len(intervalPresets):  # 末尾显示当前缩放值的那一项
+            return
         if not self.playStatus:
             self.mediaPlay()
-        oldInterval = self.globalInterval
-        self.globalInterval = {0: 20, 1: 50, 2: 100, 3: 400, 4: 500, 5: 1000}[index]
-        self.timer.setInterval(self.globalInterval)
-        self.subTimer.setInterval(self.globalInterval)
-        self.refill.setGlobalInterval(self.globalInterval)
-#         self.initSubtitle()
-#         row = self.player.position() // self.globalInterval
-#         self.subtitle.selectRow(row)
-#         self.subtitle.verticalScrollBar().setValue(row - 10)
-        self.initProcess.show()
-        try:
-            self.subtitle.cellChanged.disconnect(self.subEdit)
-        except:
-            pass
-        self.asyncTable = asyncTable(self.subtitleDict, oldInterval, self.globalInterval,\
-                                     self.duration, self.subtitle, self.autoSub, self.tablePreset, self.player.position())
-        self.asyncTable.reconnect.connect(self.reconnectCell)
-        self.asyncTable.start()
-#         self.subtitle.cellChanged.connect(self.subEdit)
-        self.initProcess.hide()
+        self.setZoom(intervalPresets[index])
+        self.setPlayhead(self.player.position() // self.globalInterval, True)
 
-    def reconnectCell(self):
-        self.subtitle.cellChanged.connect(self.subEdit)
+    def syncIntervalComBox(self):
+        '''
+        下拉框跟随当前间隔 不是预设档位时在末尾加一项显示实际毫秒数
+        '''
+        comBox = self.globalIntervalComBox
+        comBox.blockSignals(True)
+        if self.globalInterval in intervalPresets:
+            if comBox.count() > len(intervalPresets):
+                comBox.removeItem(len(intervalPresets))
+            comBox.setCurrentIndex(intervalPresets.index(self.globalInterval))
+        else:
+            if comBox.count() == len(intervalPresets):
+                comBox.addItem('')
+            comBox.setItemText(len(intervalPresets), '间隔 %sms' % self.globalInterval)
+            comBox.setCurrentIndex(len(intervalPresets))
+        comBox.blockSignals(False)
+
+    def setZoom(self, interval):
+        '''
+        缩放时间轴 只改变模型每行代表的毫秒数 表格只重绘可见的行
+        interval可以是任意毫秒数 Ctrl+滚轮连续缩放
+        '''
+        interval = min(max(int(interval), 10), 5000)
+        if interval == self.globalInterval:
+            return
+        topTime = max(self.subtitle.rowAt(0), 0) * self.globalInterval  # 缩放前后保持顶部时间不变
+        self.globalInterval = interval
+        self.timer.setInterval(max(interval, 20))
+        self.subTimer.setInterval(max(interval, 20))
+        self.subtitleModel.setInterval(interval)
+        self.subtitle.verticalScrollBar().setValue(topTime // interval)
+        self.playheadDelegate.row = self.player.position() // interval
+        self.syncIntervalComBox()
 
     def moveForward(self):
-        self.initProcess.show()
-        self.subtitle.cellChanged.disconnect(self.subEdit)
-        index = self.subEditComBox.currentIndex()
-        for y in range(self.subtitle.rowCount()):
-            if self.subtitle.rowSpan(y, index) > 1:
-                self.subtitle.setSpan(y, index, 1, 1)
-            self.subtitle.setItem(y, index, QTableWidgetItem(''))
-            self.subtitle.item(y, index).setBackground(QBrush(QColor('#232629')))
-        tmpDict = self.subtitleDict[index]
-        self.subtitleDict[index] = {}
-        for start, rowData in tmpDict.items():
-            self.subtitleDict[index][start - self.globalInterval] = rowData
-        for start, rowData in self.subtitleDict[index].items():
-            startRow = start // self.globalInterval
-            endRow = startRow + rowData[0] // self.globalInterval
-            for row in range(startRow, endRow):
-                self.subtitle.setItem(row, index, QTableWidgetItem(rowData[1]))
-                try:
-                    self.subtitle.item(row, index).setBackground(QBrush(QColor('#35545d')))
-                except:
-                    pass
-            if endRow - startRow > 1:
-                self.subtitle.setSpan(startRow, index, endRow - startRow, 1)
-        self.subtitle.cellChanged.connect(self.subEdit)
-        self.initProcess.hide()
+        self.nudgeTrack(-1)
 
     def moveAfterward(self):
-        self.initProcess.show()
-        self.subtitle.cellChanged.disconnect(self.subEdit)
+        self.nudgeTrack(1)
+
+    def nudgeTrack(self, direction):
+        '''
+        平移当前字幕轨道 只改轨道的offset 并只重绘可见的行
+        如果在该列选中了多行 则只平移选中时间段内开始的字幕
+        '''
         index = self.subEditComBox.currentIndex()
-        for y in range(self.subtitle.rowCount()):
-            if self.subtitle.rowSpan(y, index) > 1:
-                self.subtitle.setSpan(y, index, 1, 1)
-            self.subtitle.setItem(y, index, QTableWidgetItem(''))
-            self.subtitle.item(y, index).setBackground(QBrush(QColor('#232629')))
-        tmpDict = self.subtitleDict[index]
-        self.subtitleDict[index] = {}
-        for start, rowData in tmpDict.items():
-            self.subtitleDict[index][start + self.globalInterval] = rowData
-        for start, rowData in self.subtitleDict[index].items():
-            startRow = start // self.globalInterval
-            endRow = startRow + rowData[0] // self.globalInterval
-            for row in range(startRow, endRow):
-                self.subtitle.setItem(row, index, QTableWidgetItem(rowData[1]))
-                try:
-                    self.subtitle.item(row, index).setBackground(QBrush(QColor('#35545d')))
-                except:
-                    pass
-            if endRow - startRow > 1:
-                self.subtitle.setSpan(startRow, index, endRow - startRow, 1)
-        self.subtitle.cellChanged.connect(self.subEdit)
-        self.initProcess.hide()
+        step = int(self.nudgeEdit.text()) if self.nudgeEdit.text() else self.globalInterval
+        delta = step * direction
+        rows = [i.row() for i in self.subtitle.selectionModel().selectedIndexes() if i.column() == index]
+        if len(rows) > 1:
+            start = min(rows) * self.globalInterval
+            end = (max(rows) + 1) * self.globalInterval
+            self.subtitleStore[index].shiftBetween(delta, start, end)
+        else:
+            self.subtitleStore[index].shift(delta)
+        if delta > 0:
+            self.setDurationByEvents()
+        self.refreshVisible(index)
+
+    def refreshVisible(self, index=None):
+        top = max(self.subtitle.rowAt(0), 0)
+        bottom = self.subtitle.rowAt(self.subtitle.viewport().height())
+        if bottom < 0:
+            bottom = self.subtitleModel.rowCount() - 1
+        self.subtitleModel.refresh(index, top * self.globalInterval, (bottom + 1) * self.globalInterval)
 
     def clearSub(self):
         index = self.subEditComBox.currentIndex()
@@ -797,17 +879,8 @@ class MainWindow(QMainWindow):  # Main window
             self.clearAutoSub()
         reply = QMessageBox.information(self, '清空字幕', '清空第 %s 列字幕条？' % (index + 1), QMessageBox.Yes | QMessageBox.No)
         if reply == QMessageBox.Yes:
-            self.initProcess.show()
-            self.subtitle.cellChanged.disconnect(self.subEdit)
-            self.subtitleDict[index] = {0: [self.globalInterval, '']}
-            for i in range(self.subtitle.rowCount()):
-                if self.subtitle.rowSpan(i, index) > 1:
-                    self.subtitle.setSpan(i, index, 1, 1)
-                self.subtitle.setItem(i, index, QTableWidgetItem(''))
-                self.subtitle.item(i, index).setBackground(QBrush(QColor('#232629')))
-                self.subtitle.setHorizontalHeaderItem(index, QTableWidgetItem('%s' % (index + 1)))
-            self.subtitle.cellChanged.connect(self.subEdit)
-            self.initProcess.hide()
+            self.subtitleStore[index].clear()
+            self.subtitleModel.refresh(index)
 
     def exportSubWindow(self, start=0, end=0, index=None):
         self.releaseKeyboard()
@@ -824,19 +897,14 @@ class MainWindow(QMainWindow):  # Main window
         end = calSubTime2(exportArgs[1])
         subStart = calSubTime2(exportArgs[2])
         index = exportArgs[3] - 1
-        subData = self.subtitleDict[index]
-        rowList = sorted(subData.keys())
-        exportRange = []
-        for t in rowList:
-            if t >= start and t <= end:
-                exportRange.append(t)
+        self.subtitleStore[index].commitOffset()
+        exportRange = self.subtitleStore[index].startingBetween(start, end + 1)
         subNumber = 1
         with open(exportArgs[-1], 'w', encoding='utf-8') as exportFile:
-            for t in exportRange:
-                text = subData[t][1]
+            for t, tEnd, text in exportRange:
                 if text:
                     start = ms2Time(t + subStart)
-                    end = ms2Time(t + subStart + subData[t][0])
+                    end = ms2Time(tEnd + subStart)
                     exportFile.write('%s\n%s --> %s\n%s\n\n' % (subNumber, start, end, text))
                     subNumber += 1
         QMessageBox.information(self, '导出字幕', '导出完成', QMessageBox.Yes)
@@ -866,12 +934,7 @@ class MainWindow(QMainWindow):  # Main window
                         break
             except:
                 pass
-            self.initProcess.show()
-            self.subtitle.cellChanged.disconnect(self.subEdit)
-            self.subtitle.setRowCount(self.duration // self.globalInterval + 1)
-            self.subtitle.setVerticalHeaderLabels(cnt2Time(self.subtitle.rowCount(), self.globalInterval))
-            self.subtitle.cellChanged.connect(self.subEdit)
-            self.initProcess.hide()
+            self.subtitleModel.setDuration(self.duration)
             url = QUrl.fromLocalFile(self.videoPath)
             self.stack.setCurrentIndex(1)
             self.playerWidget.setSize(QSizeF(1280, 720))
@@ -883,7 +946,7 @@ class MainWindow(QMainWindow):  # Main window
             self.timer.timeout.connect(self.timeOut)
             self.subTimer.start()
             self.subTimer.timeout.connect(self.subTimeOut)
-            self.autoSub = dict()
+            self.autoSub.clear()
 
     def popDnld(self):
         self.releaseKeyboard()
@@ -905,44 +968,43 @@ class MainWindow(QMainWindow):  # Main window
         self.tablePreset = preset
 
     def setAutoSubtitle(self, voiceList):
-        self.subtitle.cellChanged.disconnect(self.subEdit)
-        for t in voiceList:
-            self.autoSub.append(t)
-            start, end = t
-            startRow = start // self.globalInterval
-            endRow = end // self.globalInterval
-            if self.tablePreset[1]:
-                self.subtitle.setItem(startRow, 0, QTableWidgetItem(self.tablePreset[0]))
-                try:
-                    self.subtitle.item(startRow, 0).setBackground(QBrush(QColor('#35545d')))
-                except:
-                    pass
-                self.subtitle.setSpan(startRow, 0, endRow - startRow, 1)
-                if self.tablePreset[0]:
-                    self.subtitleDict[0][start] = [end - start, self.tablePreset[0]]
-            else:
-                for y in range(startRow, endRow):
-                    self.subtitle.setItem(y, 0, QTableWidgetItem(self.tablePreset[0]))
-                    try:
-                        self.subtitle.item(y, 0).setBackground(QBrush(QColor('#35545d')))
-                    except:
-                        pass
-                    if self.tablePreset[0]:
-                        self.subtitleDict[0][y * self.globalInterval] = [self.globalInterval, self.tablePreset[0]]
-        self.subtitle.cellChanged.connect(self.subEdit)
+        self.pendingAutoSub += voiceList
+        if not self.autoSubTimer.isActive():
+            self.autoSubTimer.start()
+
+    def flushAutoSubtitle(self):
+        '''
+        把缓存的AI打轴结果一次性写入第一列字幕 只发一次dataChanged
+        '''
+        voiceList = self.pendingAutoSub
+        self.pendingAutoSub = []
+        if not voiceList:
+            return
+        self.autoSub.extend(voiceList)
+        fillText, autoSpan = self.tablePreset
+        if autoSpan:
+            events = [(start, end, fillText) for start, end in voiceList]
+        else:
+            interval = self.globalInterval
+            events = [(start, start + interval, fillText) for start in rowStarts(voiceList, interval).tolist()]
+        self.subtitleStore[0].addMany(events)
+        self.setDurationByEvents()
+        self.subtitleModel.refresh(0, min(t[0] for t in voiceList), max(t[1] for t in voiceList))
 
     def clearAutoSub(self):
-        self.autoSub = []
+        self.autoSub.clear()
+        self.pendingAutoSub = []
 
     def decode(self):
         self.releaseKeyboard()
-        self.videoDecoder.setDefault(self.videoPath, self.videoWidth, self.videoHeight, self.duration, self.bitrate, self.fps, self.subtitleDict)
+        self.subtitleStore.commitOffset()
+        self.videoDecoder.setDefault(self.videoPath, self.videoWidth, self.videoHeight, self.duration, self.bitrate, self.fps, self.subtitleStore)
         self.videoDecoder.hide()
         self.videoDecoder.show()
 
     def timeMarkSrt(self):
         self.releaseKeyboard()
-        self.exportSrt.setDefault(self.autoSub, self.duration)
+        self.exportSrt.setDefault(self.autoSub, self.duration, self.tablePreset[0])
         self.exportSrt.show()
 
     def mediaPlay(self):
@@ -1008,16 +1070,36 @@ class MainWindow(QMainWindow):  # Main window
         return t
 
     def timeOut(self):
-        row = self.player.position() // self.globalInterval
-        self.subtitle.selectRow(row)
-        self.subtitle.verticalScrollBar().setValue(row - 10)
-        if self.dnldWindow.isHidden() or self.exportWindow.isHidden() or self.videoDecoder.isHidden():
+        position = self.player.position()
+        row = position // self.globalInterval
+        if row != self.playheadDelegate.row:
+            self.setPlayhead(row)
+        if QWidget.keyboardGrabber() is not self and \
+           (self.dnldWindow.isHidden() or self.exportWindow.isHidden() or self.videoDecoder.isHidden()):
             self.grabKeyboard()
-        try:
-            self.videoSlider.setValue(self.player.position() * 1000 / self.player.duration())
-            self.setTimeLabel()
-        except:
-            pass
+        second = position // 1000
+        if second != self.labelSecond:
+            self.labelSecond = second
+            try:
+                self.videoSlider.setValue(position * 1000 / self.player.duration())
+                self.setTimeLabel()
+            except:
+                pass
+
+    def setPlayhead(self, row, center=False):
+        '''
+        移动播放位置标记 只重绘新旧两行 标记离开可见区域时才滚动表格
+        '''
+        oldRow = self.playheadDelegate.row
+        self.playheadDelegate.row = row
+        viewport = self.subtitle.viewport()
+        for r in (oldRow, row):
+            if r >= 0:
+                viewport.update(QRect(0, self.subtitle.rowViewportPosition(r), viewport.width(), self.subtitle.rowHeight(r)))
+        top = self.subtitle.rowAt(0)
+        bottom = self.subtitle.rowAt(viewport.height() - 1)
+        if center or top < 0 or row < top or (bottom >= 0 and row > bottom):
+            self.subtitle.verticalScrollBar().setValue(row - 10)
 
     def timeStop(self):
         self.timer.stop()
@@ -1072,6 +1154,13 @@ class MainWindow(QMainWindow):  # Main window
         if obj == self.view:
             if event.type() == QEvent.MouseButtonPress:
                 self.mediaPlay()
+        elif obj == self.subtitle.viewport():
+            if event.type() == QEvent.Wheel and event.modifiers() & Qt.ControlModifier:
+                if event.angleDelta().y() > 0:
+                    self.setZoom(self.globalInterval / 1.25)
+                else:
+                    self.setZoom(self.globalInterval * 1.25 + 1)
+                return True
         return QMainWindow.eventFilter(self, obj, event)
 
     def keyPressEvent(self, QKeyEvent):
@@ -0,0 +1,271 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+
+import os
+import json
+import time
+import mmap
+import hashlib
+from array import array
+from itertools import accumulate, chain
+from utils.subtitleParser import parseCaptions, parseAss
+
+cacheDir = os.path.join('cache', 'subtitle')
+cacheLimit = 256 * 1024 * 1024  # 缓存目录超过这个大小时删掉最久没用过的
+magic = b'DDKC1\n'
+
+
+def _indexPath():
+    return os.path.join(cacheDir, 'index.json')
+
+
+def _loadIndex():
+    try:
+        with open(_indexPath(), 'r', encoding='utf-8') as f:
+            index = json.load(f)
+        if 'files' in index and 'entries' in index:
+            return index
+    except (OSError, ValueError):
+        pass
+    return {'files': {}, 'entries': {}}
+
+
+def _saveIndex(index):
+    tempPath = _indexPath() + '.tmp'
+    with open(tempPath, 'w', encoding='utf-8') as f:
+        json.dump(index, f)
+    os.replace(tempPath, _indexPath())
+
+
+def _fileKey(subtitlePath, index):
+    '''
+    大小和修改时间都没变就沿用上次算的内容hash 否则重新读文件算hash
+    '''
+    stat = os.stat(subtitlePath)
+    path = os.path.abspath(subtitlePath)
+    known = index['files'].get(path)
+    if known and known[0] == stat.st_size and known[1] == stat.st_mtime_ns:
+        return known[2]
+    digest = hashlib.blake2b(digest_size=20)
+    with open(subtitlePath, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    key = '%s_%s' % (digest.hexdigest(), stat.st_size)
+    index['files'][path] = [stat.st_size, stat.st_mtime_ns, key]
+    return key
+
+
+def _packTexts(texts):
+    '''
+    receive list of str
+    return utf-8 blob, array of each text's end index in the decoded blob
+    '''
+    return ''.join(texts).encode('utf-8'), array('q', accumulate(map(len, texts)))
+
+
+def _unpackTexts(blob, cuts):
+    joined = blob.decode('utf-8')
+    return [joined[start:end] for start, end in zip(chain([0], cuts), cuts)]
+
+
+def _packEvents(events):
+    '''
+    (start, end, text[, words]) -> 各列数组
+    '''
+    starts = array('q')
+    ends = array('q')
+    texts = []
+    wordCounts = array('q')
+    wordOffsets = array('q')
+    wordCuts = array('q')
+    for start, end, text, *words in events:
+        starts.append(start)
+        ends.append(end)
+        texts.append(text)
+        words = words[0] if words else None
+        if words:
+            wordCounts.append(len(words[0]))
+            wordOffsets.extend(words[0])
+            wordCuts.extend(words[1])
+        else:
+            wordCounts.append(0)
+    blob, cuts = _packTexts(texts)
+    return {'starts': starts, 'ends': ends, 'texts': blob, 'textCuts': cuts,
+            'wordCounts': wordCounts, 'wordOffsets': wordOffsets, 'wordCuts': wordCuts}
+
+
+def _unpackEvents(sections):
+    texts = _unpackTexts(sections['texts'], sections['textCuts'])
+    wordCounts = sections['wordCounts']
+    if not any(wordCounts):
+        return list(zip(sections['starts'], sections['ends'], texts))
+    wordOffsets = sections['wordOffsets']
+    wordCuts = sections['wordCuts']
+    events = []
+    pos = 0
+    for start, end, text, count in zip(sections['starts'], sections['ends'], texts, wordCounts):
+        if count:
+            events.append((start, end, text, (wordOffsets[pos:pos + count], wordCuts[pos:pos + count])))
+            pos += count
+        else:
+            events.append((start, end, text, None))
+    return events
+
+
+def _packAss(parsed):
+    '''
+    parseAss的结果 样式放进json头 事件的三列字符串各拼成一块
+    '''
+    styles, events = parsed
+    names = list(events)
+    rows = [row for name in names for row in events[name]]
+    sections = {}
+    for column, key in enumerate(('start', 'end', 'text')):
+        sections[key], sections[key + 'Cuts'] = _packTexts([row[column] for row in rows])
+    header = {'styles': styles, 'names': names, 'counts': [len(events[name]) for name in names]}
+    return header, sections
+
+
+def _unpackAss(header, sections):
+    columns = [_unpackTexts(sections[key], sections[key + 'Cuts']) for key in ('start', 'end', 'text')]
+    rows = [list(row) for row in zip(*columns)]
+    events = {}
+    pos = 0
+    for name, count in zip(header['names'], header['counts']):
+        events[name] = rows[pos:pos + count]
+        pos += count
+    return header['styles'], events
+
+
+def _write(cachePath, header, sections):
+    '''
+    magic | json头长度 | json头 | 各段原始字节
+    '''
+    header['sections'] = [[name, data.typecode if isinstance(data, array) else '', len(memoryview(data).cast('B'))] for name, data in sections.items()]
+    headerBytes = json.dumps(header, ensure_ascii=False).encode('utf-8')
+    tempPath = cachePath + '.tmp'
+    with open(tempPath, 'wb') as f:
+        f.write(magic)
+        f.write(len(headerBytes).to_bytes(4, 'little'))
+        f.write(headerBytes)
+        for data in sections.values():
+            f.write(data)
+    os.replace(tempPath, cachePath)
+
+
+def _read(cachePath):
+    with open(cachePath, 'rb') as f:
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            if mm[:len(magic)] != magic:
+                return None, None
+            pos = len(magic)
+            headerSize = int.from_bytes(mm[pos:pos + 4], 'little')
+            pos += 4
+            header = json.loads(mm[pos:pos + headerSize].decode('utf-8'))
+            pos += headerSize
+            sections = {}
+            for name, typecode, size in header['sections']:
+                if typecode:
+                    sections[name] = array(typecode)
+                    sections[name].frombytes(mm[pos:pos + size])
+                else:
+                    sections[name] = mm[pos:pos + size]
+                pos += size
+    return header, sections
+
+
+def _evict(index):
+    '''
+    按最近使用时间从旧到新删除 直到缓存总大小不超过cacheLimit
+    '''
+    entries = index['entries']
+    total = sum(entry['size'] for entry in entries.values())
+    for key in sorted(entries, key=lambda key: entries[key]['used']):
+        if total <= cacheLimit:
+            break
+        try:
+            os.remove(os.path.join(cacheDir, key))
+        except OSError:
+            pass
+        total -= entries.pop(key)['size']
+    known = set(entries)
+    index['files'] = {path: value for path, value in index['files'].items() if value[2] in known}
+
+
+def pack(subtitlePath, parsed):
+    '''
+    receive path and parsed result of a srt/vtt/ass file
+    return header, sections 可以直接写进缓存 也方便在进程间传递
+    '''
+    if subtitlePath.endswith('.ass'):
+        header, sections = _packAss(parsed)
+        header['kind'] = 'ass'
+    else:
+        header, sections = {'kind': 'cue'}, _packEvents(parsed)
+    return header, sections
+
+
+def unpack(header, sections):
+    if header['kind'] == 'ass':
+        return _unpackAss(header, sections)
+    return _unpackEvents(sections)
+
+
+def parseFile(subtitlePath):
+    '''
+    receive path of a srt/vtt/ass file
+    return packed header, sections
+    批量导入时在子进程里运行 打包后的几段数组比事件元组列表序列化快得多
+    '''
+    with open(subtitlePath, 'r', encoding='utf-8-sig', errors='replace') as f:
+        if subtitlePath.endswith('.ass'):
+            parsed = parseAss(f)
+        else:
+            parsed = list(parseCaptions(f))
+    return pack(subtitlePath, parsed)
+
+
+def load(subtitlePath):
+    '''
+    receive path of a srt/vtt/ass file
+    return parsed result same as the parser, or None if not cached
+    '''
+    try:
+        index = _loadIndex()
+        key = _fileKey(subtitlePath, index)
+        if key not in index['entries']:
+            if os.path.isdir(cacheDir):
+                _saveIndex(index)  # 记住这次算的hash 解析完保存时不用再算
+            return None
+        header, sections = _read(os.path.join(cacheDir, key))
+        if header is None:
+            return None
+        index['entries'][key]['used'] = time.time()
+        _saveIndex(index)
+    except (OSError, ValueError, KeyError):
+        return None
+    return unpack(header, sections)
+
+
+def store(subtitlePath, header, sections):
+    '''
+    缓存写入失败不影响导入
+    '''
+    try:
+        os.makedirs(cacheDir, exist_ok=True)
+        index = _loadIndex()
+        key = _fileKey(subtitlePath, index)
+        cachePath = os.path.join(cacheDir, key)
+        _write(cachePath, header, sections)
+        index['entries'][key] = {'size': os.path.getsize(cachePath), 'used': time.time()}
+        _evict(index)
+        _saveIndex(index)
+    except (OSError, ValueError):
+        pass
+
+
+def save(subtitlePath, parsed):
+    '''
+    receive path and parsed result of a srt/vtt/ass file
+    '''
+    store(subtitlePath, *pack(subtitlePath, parsed))
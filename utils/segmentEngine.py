@@ -0,0 +1,194 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+
+import numpy as np
+
+
+class SegmentEngine(object):
+    '''
+    AI打轴得到的语音段
+    start/end分别保存在int64数组里 新结果先攒在pending 用到时才拼接排序
+    裁剪、合并、忽略、偏移都是整列的数组运算
+    '''
+    def __init__(self):
+        self.starts = np.empty(0, np.int64)
+        self.ends = np.empty(0, np.int64)
+        self.pending = []
+
+    def __len__(self):
+        return len(self.starts) + sum(len(chunk) for chunk in self.pending)
+
+    def extend(self, voiceList):
+        '''
+        receive [[start, end], ...] from separateQThread
+        '''
+        if voiceList:
+            self.pending.append(np.asarray(voiceList, np.int64).reshape(-1, 2))
+
+    def clear(self):
+        self.starts = np.empty(0, np.int64)
+        self.ends = np.empty(0, np.int64)
+        self.pending = []
+
+    def segments(self):
+        '''
+        return starts, ends sorted by start
+        '''
+        if self.pending:
+            chunk = np.concatenate(self.pending)
+            starts = np.concatenate([self.starts, chunk[:, 0]])
+            ends = np.concatenate([self.ends, chunk[:, 1]])
+            order = np.argsort(starts, kind='stable')
+            self.starts = starts[order]
+            self.ends = ends[order]
+            self.pending = []
+        return self.starts, self.ends
+
+    def process(self, startPos, endPos, relative=True, offset=0, maxIgnore=0, maxMerge=0, mergeFirst=True):
+        '''
+        receive ms
+        return starts, ends after clip / merge / ignore / shift
+        maxIgnore: 时长不超过该值的语音段被忽略 0不忽略
+        maxMerge: 间隔不超过该值的相邻语音段被合并 0不合并
+        mergeFirst: 一段既能合并又能忽略时先合并
+        '''
+        starts, ends = self.segments()
+        keep = (ends > startPos) & (starts < endPos)
+        starts = np.clip(starts[keep], startPos, endPos)
+        ends = np.clip(ends[keep], startPos, endPos)
+        if mergeFirst:
+            starts, ends = mergeSegments(starts, ends, maxMerge)
+            starts, ends = ignoreSegments(starts, ends, maxIgnore)
+        else:
+            starts, ends = ignoreSegments(starts, ends, maxIgnore)
+            starts, ends = mergeSegments(starts, ends, maxMerge)
+        shift = offset - startPos if relative else offset
+        return starts + shift, ends + shift
+
+
+def mergeSegments(starts, ends, maxMerge):
+    '''
+    相邻语音段的空白不超过maxMerge时合并成一段
+    '''
+    if not maxMerge or len(starts) < 2:
+        return starts, ends
+    reach = np.maximum.accumulate(ends)  # 前面所有段最远到哪里 处理重叠的段
+    newGroup = np.empty(len(starts), bool)
+    newGroup[0] = True
+    newGroup[1:] = starts[1:] - reach[:-1] > maxMerge
+    heads = np.flatnonzero(newGroup)
+    return starts[heads], np.maximum.reduceat(ends, heads)
+
+
+def ignoreSegments(starts, ends, maxIgnore):
+    '''
+    时长不超过maxIgnore的语音段去掉
+    '''
+    if not maxIgnore:
+        return starts, ends
+    keep = ends - starts > maxIgnore
+    return starts[keep], ends[keep]
+
+
+def rowStarts(voiceList, interval):
+    '''
+    receive [[start, end], ...], row interval
+    return int64 array of the start of every table row covered by these segments
+    主界面不按语音段长度合并格子时用
+    '''
+    chunk = np.asarray(voiceList, np.int64).reshape(-1, 2)
+    first = chunk[:, 0] // interval
+    counts = np.maximum(chunk[:, 1] // interval - first, 0)
+    rows = np.repeat(first, counts)
+    steps = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    return (rows + steps) * interval
+
+
+def srtTimes(ms):
+    '''
+    receive int64 array
+    return list of 'hh:mm:ss,mmm'
+    '''
+    h, rest = np.divmod(ms, 3600000)
+    m, rest = np.divmod(rest, 60000)
+    s, rest = np.divmod(rest, 1000)
+    return ['%02d:%02d:%02d,%03d' % t for t in zip(h.tolist(), m.tolist(), s.tolist(), rest.tolist())]
+
+
+def writeSrt(srtPath, starts, ends, fillText, numbered=True, chunkSize=10000):
+    '''
+    分块格式化后写入 不在内存里拼出整份文件
+    每条字幕都写上fillText(打轴时的填充文本) 没有文字的cue再导入时会被丢掉
+    '''
+    fillText = fillText.strip() or '-'
+    with open(srtPath, 'w', encoding='utf-8') as f:
+        for chunk in range(0, len(starts), chunkSize):
+            startTimes = srtTimes(starts[chunk:chunk + chunkSize])
+            endTimes = srtTimes(ends[chunk:chunk + chunkSize])
+            if numbered:
+                f.write(''.join('%s\n%s --> %s\n%s\n\n' % (chunk + cnt + 1, start, end, fillText) for cnt, (start, end) in enumerate(zip(startTimes, endTimes))))
+            else:
+                f.write(''.join('%s --> %s\n%s\n\n' % (start, end, fillText) for start, end in zip(startTimes, endTimes)))
+
+
+if __name__ == '__main__':
+    # python -m utils.segmentEngine [轮数]  随机语音段 与逐条处理的纯Python写法比对 再导出srt用解析器读回
+    import os
+    import sys
+    import random
+    import tempfile
+    from utils.subtitleParser import parseSubtitle
+
+    def referenceProcess(segments, startPos, endPos, relative, offset, maxIgnore, maxMerge, mergeFirst):
+        segments = sorted(segments, key=lambda segment: segment[0])
+        segments = [[max(start, startPos), min(end, endPos)] for start, end in segments if end > startPos and start < endPos]
+
+        def merge(segments):
+            if not maxMerge:
+                return segments
+            merged = []
+            for start, end in segments:
+                if merged and start - merged[-1][1] <= maxMerge:
+                    merged[-1][1] = max(merged[-1][1], end)
+                else:
+                    merged.append([start, end])
+            return merged
+
+        def ignore(segments):
+            return [segment for segment in segments if not maxIgnore or segment[1] - segment[0] > maxIgnore]
+
+        segments = ignore(merge(segments)) if mergeFirst else merge(ignore(segments))
+        shift = offset - startPos if relative else offset
+        return [start + shift for start, _ in segments], [end + shift for _, end in segments]
+
+    rounds = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    for _ in range(rounds):
+        engine = SegmentEngine()
+        segments = []
+        for _ in range(random.randrange(0, 4)):
+            chunk = []
+            for _ in range(random.randrange(0, 30)):
+                start = random.randrange(0, 100000)
+                chunk.append([start, start + random.randrange(0, 3000)])
+            engine.extend(chunk)
+            segments += chunk
+        assert len(engine) == len(segments)
+        startPos = random.randrange(0, 60000)
+        args = (startPos, startPos + random.randrange(0, 60000), random.random() < 0.5, random.randrange(-5000, 5000),
+                random.choice([0, random.randrange(0, 2000)]), random.choice([0, random.randrange(0, 2000)]), random.random() < 0.5)
+        starts, ends = engine.process(*args)
+        assert (starts.tolist(), ends.tolist()) == referenceProcess(segments, *args), args
+        interval = random.choice([20, 50, 100, 200, 500, 1000])
+        expected = [row * interval for start, end in segments for row in range(start // interval, end // interval)]
+        assert rowStarts(segments, interval).tolist() == expected
+    print('%s rounds ok' % rounds)
+
+    srtPath = os.path.join(tempfile.gettempdir(), 'segment_check.srt')
+    for numbered in (True, False):
+        writeSrt(srtPath, starts, ends, '#AI自动识别', numbered, chunkSize=7)
+        with open(srtPath, 'r', encoding='utf-8') as f:
+            parsed = list(parseSubtitle(f))
+        assert [(start, end) for start, end, _ in parsed] == [(start, end) for start, end in zip(starts.tolist(), ends.tolist()) if end - start > 10]
+        assert all(text == '#AI自动识别' for _, _, text in parsed)
+    os.remove(srtPath)
+    print('srt round trip ok')
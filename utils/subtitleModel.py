@@ -0,0 +1,154 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+
+from PySide2.QtWidgets import QStyledItemDelegate
+from PySide2.QtCore import Qt, QAbstractTableModel, QModelIndex
+from PySide2.QtGui import QBrush, QColor
+
+
+def ms2Label(ms):
+    '''
+    receive int
+    return str
+    ms -> m:s.ms (时间轴行号)
+    '''
+    m, s = divmod(ms, 60000)
+    s, ms = divmod(s, 1000)
+    return ('%s:%02d.%03d' % (m, s, ms))[:-1]
+
+
+class SubtitleModel(QAbstractTableModel):
+    '''
+    字幕轨道表格的数据模型
+    格子内容和颜色都由subtitleStore按需计算 不再为每个格子创建QTableWidgetItem
+    '''
+    def __init__(self, subtitleStore, interval, duration, parent=None):
+        super(SubtitleModel, self).__init__(parent)
+        self.subtitleStore = subtitleStore
+        self.interval = interval
+        self.duration = duration
+        self.fillBrush = QBrush(QColor('#35545d'))
+        self.emptyBrush = QBrush(QColor('#232629'))
+
+    def rowCount(self, parent=QModelIndex()):
+        if parent.isValid():
+            return 0
+        return self.duration // self.interval + 1
+
+    def columnCount(self, parent=QModelIndex()):
+        if parent.isValid():
+            return 0
+        return len(self.subtitleStore)
+
+    def findEvent(self, row, index):
+        '''
+        receive row, column
+        return (start, end, text) of the subtitle covering this row or None
+        '''
+        rowStart = row * self.interval
+        events = self.subtitleStore[index].between(rowStart, rowStart + self.interval)
+        return events[-1] if events else None
+
+    def cellText(self, row, index):
+        event = self.findEvent(row, index)
+        return event[2] if event else ''
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        if role in (Qt.DisplayRole, Qt.EditRole, Qt.ToolTipRole, Qt.BackgroundRole):
+            event = self.findEvent(index.row(), index.column())
+            if role == Qt.BackgroundRole:
+                return self.fillBrush if event else self.emptyBrush
+            if not event:
+                return ''
+            if role == Qt.DisplayRole and max(event[0], 0) // self.interval != index.row():
+                return ''  # 跨多行的字幕只在第一行显示文字
+            return event[2]
+        return None
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if role != Qt.DisplayRole:
+            return None
+        if orientation == Qt.Horizontal:
+            return '%s' % (section + 1)
+        return ms2Label(section * self.interval)
+
+    def flags(self, index):
+        if not index.isValid():
+            return Qt.NoItemFlags
+        return Qt.ItemIsEnabled | Qt.ItemIsSelectable | Qt.ItemIsEditable
+
+    def setData(self, index, value, role=Qt.EditRole):
+        if role != Qt.EditRole or not index.isValid():
+            return False
+        row = index.row()
+        column = index.column()
+        event = self.findEvent(row, column)
+        if event:
+            start, end, _ = event
+            if value:
+                self.subtitleStore[column].add(start, end, value)
+            else:
+                self.subtitleStore[column].remove(start)
+        elif value:
+            start, end = row * self.interval, (row + 1) * self.interval
+            self.subtitleStore[column].add(start, end, value)
+        else:
+            return False
+        self.refresh(column, start, end)
+        return True
+
+    def refresh(self, index=None, start=None, end=None):
+        '''
+        subtitleStore被修改后调用 只通知受影响的行重绘
+        '''
+        if index is None:
+            first, last = 0, self.columnCount() - 1
+        else:
+            first = last = index
+        startRow = 0 if start is None else max(start, 0) // self.interval
+        endRow = self.rowCount() - 1 if end is None else min(max(end - 1, 0) // self.interval, self.rowCount() - 1)
+        if startRow <= endRow:
+            self.dataChanged.emit(self.index(startRow, first), self.index(endRow, last))
+
+    def setDuration(self, duration):
+        oldRows = self.rowCount()
+        newRows = duration // self.interval + 1
+        if newRows > oldRows:
+            self.beginInsertRows(QModelIndex(), oldRows, newRows - 1)
+            self.duration = duration
+            self.endInsertRows()
+        elif newRows < oldRows:
+            self.beginRemoveRows(QModelIndex(), newRows, oldRows - 1)
+            self.duration = duration
+            self.endRemoveRows()
+        else:
+            self.duration = duration
+
+    def addTrack(self):
+        column = len(self.subtitleStore)
+        self.beginInsertColumns(QModelIndex(), column, column)
+        self.subtitleStore.addTrack()
+        self.endInsertColumns()
+        return column
+
+    def setInterval(self, interval):
+        self.beginResetModel()
+        self.interval = interval
+        self.endResetModel()
+
+
+class PlayheadDelegate(QStyledItemDelegate):
+    '''
+    在播放位置所在的行上叠加一层高亮 代替每次都selectRow
+    '''
+    def __init__(self, parent=None):
+        super(PlayheadDelegate, self).__init__(parent)
+        self.row = -1
+        self.brush = QBrush(QColor(61, 174, 233, 90))
+
+    def paint(self, painter, option, index):
+        super(PlayheadDelegate, self).paint(painter, option, index)
+        if index.row() == self.row:
+            painter.fillRect(option.rect, self.brush)
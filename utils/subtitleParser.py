@@ -0,0 +1,217 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+
+import re
+import html
+from array import array
+from itertools import accumulate, chain, islice
+
+# 00:00:01,000 --> 00:00:02,500 或 00:01.000 --> 00:02.500 align:start position:0%
+cueLine = re.compile(r'\s*(?:(\d+)[:：])?(\d+)[:：](\d+)(?:[.,](\d+))?\s*-->\s*(?:(\d+)[:：])?(\d+)[:：](\d+)(?:[.,](\d+))?')
+tagPattern = re.compile(r'<[^>]*>')
+inlineTime = re.compile(r'<(\d+):(\d+):(\d+)[.,](\d+)>')  # 自动字幕每个字前面的时间
+
+
+def _ms(h, m, s, ms):
+    '''
+    receive str groups of a timestamp
+    return int ms
+    '''
+    total = int(m) * 60000 + int(s) * 1000
+    if h:
+        total += int(h) * 3600000
+    if ms:
+        total += int((ms + '00')[:3])
+    return total
+
+
+def _cues(lines):
+    '''
+    receive iterable of str
+    yield (start_ms, end_ms, [text lines]) of each cue, 10ms以内的字幕(YouTube自动字幕的重复行)会被跳过
+    '''
+    match = cueLine.match
+    start = end = None
+    text = []
+    for line in lines:
+        if '-->' in line:
+            if len(line) >= 29 and line[2] == ':' and line[12:17] == ' --> ' and line[19] == ':':
+                # 最常见的 00:00:01.000 --> 00:00:02.500 直接按位置切片
+                if text and end - start > 10:
+                    yield start, end, text
+                start = int(line[0:2]) * 3600000 + int(line[3:5]) * 60000 + int(line[6:8]) * 1000 + int(line[9:12])
+                end = int(line[17:19]) * 3600000 + int(line[20:22]) * 60000 + int(line[23:25]) * 1000 + int(line[26:29])
+                text = []
+                continue
+            groups = match(line)
+            if groups:
+                if text and end - start > 10:
+                    yield start, end, text
+                groups = groups.groups()
+                start = _ms(*groups[:4])
+                end = _ms(*groups[4:])
+                text = []
+                continue
+        if start is None:
+            continue
+        if line.strip('\r\n'):
+            line = line.strip()
+            if line:  # 只有空格的行不算cue结束
+                text.append(line)
+        else:
+            if text and end - start > 10:
+                yield start, end, text
+            start = None
+            text = []
+    if text and end - start > 10:
+        yield start, end, text
+
+
+def _cueText(lines):
+    text = lines[0] if len(lines) == 1 else ' '.join(lines)
+    if '<' in text:
+        text = tagPattern.sub('', text)
+    if '&' in text:
+        text = html.unescape(text)
+    return text
+
+
+def parseSubtitle(lines):
+    '''
+    receive iterable of str (file object / list of lines)
+    yield (start_ms, end_ms, text) of each srt/vtt cue in file order
+    只遍历一次 不需要向后看行
+    '''
+    for start, end, text in _cues(lines):
+        yield start, end, _cueText(text)
+
+
+def parseAutoCaption(lines):
+    '''
+    receive iterable of str of a YouTube auto caption vtt
+    yield (start_ms, end_ms, text, words) in file order
+    words = (array of each word's start offset from start_ms, array of each word's end index in text)
+    滚动显示时上一行会在下一条cue里重复出现 只取每条cue的最后一行 和上一条相同就跳过
+    '''
+    last = ''
+    for start, end, text in _cues(lines):
+        line = text[-1]
+        if '<' in line:
+            pieces = inlineTime.split(line)  # [字, h, m, s, ms, 字, h, m, s, ms, 字...]
+            parts = [tagPattern.sub('', piece) for piece in pieces[::5]]
+            if '&' in line:
+                parts = [html.unescape(part) for part in parts]
+            parts[0] = parts[0].lstrip()
+            parts[-1] = parts[-1].rstrip()
+            offsets = array('q', [0])
+            offsets.extend(_ms(*pieces[i:i + 4]) - start for i in range(1, len(pieces), 5))
+            line = ''.join(parts)
+            if line == last:
+                continue
+            yield start, end, line, (offsets, array('q', accumulate(map(len, parts))))
+        else:
+            line = _cueText([line])
+            if line == last:
+                continue
+            yield start, end, line, None
+        last = line
+
+
+def parseCaptions(lines):
+    '''
+    receive iterable of str of a srt/vtt file
+    yield (start_ms, end_ms, text) or (start_ms, end_ms, text, words)
+    开头几十行里有<c>逐字时间时按YouTube自动字幕解析 并多带一项words
+    '''
+    lines = iter(lines)
+    head = list(islice(lines, 50))
+    if any('<c>' in line for line in head):
+        return parseAutoCaption(chain(head, lines))
+    return parseSubtitle(chain(head, lines))
+
+
+def assTime(t):
+    '''
+    receive str
+    return int
+    h:mm:ss.cc -> ms in total
+    '''
+    if len(t) == 10 and t[1] == ':' and t[4] == ':' and t[7] == '.':
+        return int(t[0]) * 3600000 + int(t[2:4]) * 60000 + int(t[5:7]) * 1000 + int(t[8:10]) * 10
+    h, m, s = t.replace('：', ':').split(':')
+    s, _, ms = s.replace(',', '.').partition('.')
+    return _ms(h, m, s, ms)
+
+
+def parseAss(lines):
+    '''
+    receive iterable of str of an ass file
+    return styles {styleName: {format: value}}, events {styleName: [[Start, End, Text], ...]}
+    只遍历一次 事件按样式分桶 时间保持原字符串 选中某个样式时再用assTime解析
+    '''
+    section = ''
+    styleFormat = []
+    styles = {}
+    eventFormat = []
+    events = {}
+    for line in lines:
+        if line.startswith('['):
+            section = line.strip().lower()
+        elif section in ('[v4+ styles]', '[v4 styles]'):
+            if line.startswith('Format:'):
+                styleFormat = [field.strip() for field in line[7:].split(',')]
+            elif line.startswith('Style:') and styleFormat:
+                style = dict(zip(styleFormat, [value.strip() for value in line[6:].split(',')]))
+                styles[style.get('Name', '')] = style
+        elif section == '[events]':
+            if line.startswith('Format:'):
+                eventFormat = [field.strip() for field in line[7:].split(',')]
+                Start = eventFormat.index('Start')
+                End = eventFormat.index('End')
+                Style = eventFormat.index('Style')
+                Text = eventFormat.index('Text')
+                splits = len(eventFormat) - 1  # Text里的逗号不拆开
+            elif eventFormat and (line.startswith('Dialogue:') or line.startswith('Comment:')):
+                fields = line[line.index(':') + 1:].split(',', splits)
+                if len(fields) > splits:
+                    styleName = fields[Style].strip()
+                    if styleName not in events:
+                        events[styleName] = []
+                    events[styleName].append([fields[Start].strip(), fields[End].strip(), fields[Text].rstrip('\r\n')])
+    return styles, events
+
+
+if __name__ == '__main__':
+    # python -m utils.subtitleParser [cue数]  生成vtt/srt并计时
+    import io
+    import sys
+    import time
+
+    def fakeTime(ms, sep):
+        h, ms = divmod(ms, 3600000)
+        m, ms = divmod(ms, 60000)
+        s, ms = divmod(ms, 1000)
+        return '%02d:%02d:%02d%s%03d' % (h, m, s, sep, ms)
+
+    cues = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    vtt = io.StringIO()
+    vtt.write('WEBVTT\nKind: captions\nLanguage: ja\n\n')
+    srt = io.StringIO()
+    for i in range(cues):
+        start, end = i * 1500, i * 1500 + 1200
+        vtt.write('%s --> %s align:start position:0%%\n字幕 %s 行 <b>テスト</b>\n\n' % (fakeTime(start, '.'), fakeTime(end, '.'), i))
+        srt.write('%s\n%s --> %s\n字幕 %s 行\n第二行\n\n' % (i + 1, fakeTime(start, ','), fakeTime(end, ','), i))
+    auto = io.StringIO()
+    auto.write('WEBVTT\nKind: captions\nLanguage: ja\n\n')
+    previous = ' '
+    for i in range(cues):
+        start, end = i * 1500, i * 1500 + 1490
+        words = ''.join('<%s><c> 字%s</c>' % (fakeTime(start + 300 * w, '.'), w) for w in range(1, 4))
+        auto.write('%s --> %s align:start position:0%%\n%s\n第%s行%s\n\n' % (fakeTime(start, '.'), fakeTime(end, '.'), previous, i, words))
+        previous = '第%s行 字1 字2 字3' % i
+        auto.write('%s --> %s align:start position:0%%\n%s\n \n\n' % (fakeTime(end, '.'), fakeTime(end + 10, '.'), previous))
+    for name, buffer, parser in (('vtt', vtt, parseSubtitle), ('srt', srt, parseSubtitle), ('auto vtt', auto, parseAutoCaption)):
+        buffer.seek(0)
+        t = time.perf_counter()
+        count = sum(1 for _ in parser(buffer))
+        print('%s: %s cues in %.3fs' % (name, count, time.perf_counter() - t))
@@ -0,0 +1,393 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+
+from array import array
+from bisect import bisect_left, bisect_right
+from itertools import accumulate
+
+longEvent = 30000  # 超过这个时长(ms)的字幕(水印、staff等整段显示的行)单独记录
+
+
+class SubtitleTrack(object):
+    '''
+    单条字幕轨道
+    开始/结束时间保存在按开始时间排好序的数组里 查询某时刻或某时间段的字幕只需二分查找
+    maxEnds[i]是ends[0..i]中短字幕结束时间的最大值 单调不减 用来找出所有可能与查询区间重叠的短字幕
+    长字幕不计入maxEnds 开始时间另存在longStarts里逐条检查 一条长字幕不会让每次查询都从头扫起
+    offset是整条轨道的时间偏移 读取时才加上 导出时再用commitOffset写回数组
+    words和texts平行 自动字幕的逐字时间(相对开始时间的偏移, 每个字的结束位置) 普通字幕为None
+    对外的接口收发的都是加上offset之后的时间
+    snapshot()和原轨道共用同一组数组(写时复制) 任何一方下次修改前才复制自己的数组
+    '''
+    def __init__(self, events=()):
+        self.starts = array('q')
+        self.ends = array('q')
+        self.texts = []
+        self.words = []
+        self.maxEnds = array('q')
+        self.longStarts = array('q')
+        self.offset = 0
+        self.shared = False  # 数组是否和快照共用
+        if events:
+            self.addMany(events)
+
+    def __len__(self):
+        return len(self.starts)
+
+    def __iter__(self):
+        '''
+        yield (start, end, text) sorted by start
+        '''
+        offset = self.offset
+        if not offset:
+            return zip(self.starts, self.ends, self.texts)
+        return ((start + offset, end + offset, text) for start, end, text in zip(self.starts, self.ends, self.texts))
+
+    def __contains__(self, start):
+        start -= self.offset
+        pos = bisect_left(self.starts, start)
+        return pos < len(self.starts) and self.starts[pos] == start
+
+    def withWords(self):
+        '''
+        yield (start, end, text, words) sorted by start
+        '''
+        offset = self.offset
+        return ((start + offset, end + offset, text, words) for start, end, text, words in zip(self.starts, self.ends, self.texts, self.words))
+
+    def lastEnd(self):
+        if not self.starts:
+            return 0
+        ends = [self.ends[bisect_left(self.starts, start)] for start in self.longStarts]
+        return max(ends + [self.maxEnds[-1]]) + self.offset
+
+    def snapshot(self):
+        '''
+        return an O(1) read-only copy sharing the arrays with this track
+        '''
+        track = SubtitleTrack()
+        track.starts = self.starts
+        track.ends = self.ends
+        track.texts = self.texts
+        track.words = self.words
+        track.maxEnds = self.maxEnds
+        track.longStarts = self.longStarts
+        track.offset = self.offset
+        track.shared = self.shared = True
+        return track
+
+    def _own(self):
+        '''
+        就地修改数组前调用 数组还和快照共用时先复制一份
+        '''
+        if self.shared:
+            self.starts = array('q', self.starts)
+            self.ends = array('q', self.ends)
+            self.texts = list(self.texts)
+            self.words = list(self.words)
+            self.maxEnds = array('q', self.maxEnds)
+            self.longStarts = array('q', self.longStarts)
+            self.shared = False
+
+    def _fixMaxEnds(self, pos):
+        '''
+        从pos开始重算前缀最大值 值不再变化时提前结束
+        '''
+        m = self.maxEnds[pos - 1] if pos else -1 << 62
+        for i in range(pos, len(self.ends)):
+            end = self.ends[i]
+            if end > m and end - self.starts[i] <= longEvent:
+                m = end
+            if self.maxEnds[i] == m and i > pos:
+                break
+            self.maxEnds[i] = m
+
+    def _setLong(self, start, isLong):
+        pos = bisect_left(self.longStarts, start)
+        known = pos < len(self.longStarts) and self.longStarts[pos] == start
+        if isLong and not known:
+            self.longStarts.insert(pos, start)
+        elif known and not isLong:
+            del self.longStarts[pos]
+
+    def _insert(self, start, end, text, words=None):
+        self._own()
+        pos = bisect_left(self.starts, start)
+        if pos < len(self.starts) and self.starts[pos] == start:
+            self.ends[pos] = end
+            self.texts[pos] = text
+            self.words[pos] = words
+        else:
+            self.starts.insert(pos, start)
+            self.ends.insert(pos, end)
+            self.texts.insert(pos, text)
+            self.words.insert(pos, words)
+            self.maxEnds.insert(pos, end)
+        self._setLong(start, end - start > longEvent)
+        self._fixMaxEnds(pos)
+
+    def add(self, start, end, text, words=None):
+        '''
+        添加一条字幕 同一开始时间的字幕会被替换 修改文字后原来的逐字时间作废
+        '''
+        self._insert(start - self.offset, end - self.offset, text, words)
+
+    def addMany(self, events):
+        '''
+        批量添加 (start, end, text) 或 (start, end, text, words) 排序一次后重建数组
+        '''
+        offset = self.offset
+        merged = dict(zip(self.starts, zip(self.ends, self.texts, self.words)))
+        for start, end, text, *words in events:
+            merged[start - offset] = (end - offset, text, words[0] if words else None)
+        starts = sorted(merged)
+        self.starts = array('q', starts)
+        self.ends = array('q', [merged[start][0] for start in starts])
+        self.texts = [merged[start][1] for start in starts]
+        self.words = [merged[start][2] for start in starts]
+        self.longStarts = array('q', [start for start, end in zip(self.starts, self.ends) if end - start > longEvent])
+        self.maxEnds = array('q', accumulate((end if end - start <= longEvent else -1 << 62 for start, end in zip(self.starts, self.ends)), max))
+        self.shared = False
+
+    def _pop(self, pos):
+        start, end, text = self.starts[pos], self.ends[pos], self.texts[pos]
+        del self.starts[pos]
+        del self.ends[pos]
+        del self.texts[pos]
+        del self.words[pos]
+        del self.maxEnds[pos]
+        self._setLong(start, False)
+        if pos < len(self.starts):
+            self._fixMaxEnds(pos)
+        return start + self.offset, end + self.offset, text
+
+    def remove(self, start):
+        self._own()
+        start -= self.offset
+        pos = bisect_left(self.starts, start)
+        if pos < len(self.starts) and self.starts[pos] == start:
+            return self._pop(pos)
+        return None
+
+    def removeBetween(self, start, end):
+        '''
+        删除与[start, end)重叠的字幕 返回被删除的字幕列表
+        '''
+        self._own()
+        removed = []
+        for pos in reversed(self._overlapPos(start, end)):
+            removed.append(self._pop(pos))
+        removed.reverse()
+        return removed
+
+    def clear(self):
+        self.starts = array('q')
+        self.ends = array('q')
+        self.texts = []
+        self.words = []
+        self.maxEnds = array('q')
+        self.longStarts = array('q')
+        self.offset = 0
+        self.shared = False
+
+    def _overlapPos(self, start, end):
+        '''
+        lo之前的短字幕都在start之前结束 只需逐条看lo和hi之前的长字幕
+        '''
+        start -= self.offset
+        end -= self.offset
+        lo = bisect_right(self.maxEnds, start)
+        hi = bisect_left(self.starts, end)
+        found = []
+        last = min(lo, hi)
+        if self.longStarts and last:
+            for longStart in self.longStarts[:bisect_right(self.longStarts, self.starts[last - 1])]:
+                pos = bisect_left(self.starts, longStart)
+                if self.ends[pos] > start:
+                    found.append(pos)
+        return found + [pos for pos in range(lo, hi) if self.ends[pos] > start]
+
+    def between(self, start, end):
+        '''
+        receive ms range
+        return [(start, end, text), ...] overlapping [start, end)
+        '''
+        offset = self.offset
+        return [(self.starts[pos] + offset, self.ends[pos] + offset, self.texts[pos]) for pos in self._overlapPos(start, end)]
+
+    def startingBetween(self, start, end):
+        '''
+        receive ms range
+        return [(start, end, text), ...] starting in [start, end)
+        '''
+        offset = self.offset
+        lo = bisect_left(self.starts, start - offset)
+        hi = bisect_left(self.starts, end - offset)
+        return [(self.starts[pos] + offset, self.ends[pos] + offset, self.texts[pos]) for pos in range(lo, hi)]
+
+    def at(self, t):
+        '''
+        receive ms
+        return (start, end, text) on screen at t, the latest started one wins
+        '''
+        events = self.between(t, t + 1)
+        return events[-1] if events else None
+
+    def shift(self, delta):
+        '''
+        整条轨道平移 只改offset O(1)
+        '''
+        self.offset += delta
+
+    def shiftBetween(self, delta, start, end):
+        '''
+        只平移开始时间在[start, end)内的字幕 O(log n + k)
+        '''
+        lo = bisect_left(self.starts, start - self.offset)
+        hi = bisect_left(self.starts, end - self.offset)
+        if lo == hi:
+            return
+        self._own()
+        moved = list(zip(self.starts[lo:hi], self.ends[lo:hi], self.texts[lo:hi], self.words[lo:hi]))
+        del self.longStarts[bisect_left(self.longStarts, self.starts[lo]):bisect_right(self.longStarts, self.starts[hi - 1])]
+        del self.starts[lo:hi]
+        del self.ends[lo:hi]
+        del self.texts[lo:hi]
+        del self.words[lo:hi]
+        del self.maxEnds[lo:hi]
+        if lo < len(self.starts):
+            self._fixMaxEnds(lo)
+        for movedStart, movedEnd, text, words in moved:
+            self._insert(movedStart + delta, movedEnd + delta, text, words)
+
+    def commitOffset(self):
+        '''
+        把offset写回数组 保存或导出前调用
+        '''
+        offset = self.offset
+        if offset:
+            self.starts = array('q', [start + offset for start in self.starts])
+            self.ends = array('q', [end + offset for end in self.ends])
+            self.maxEnds = array('q', [end + offset for end in self.maxEnds])
+            self.longStarts = array('q', [start + offset for start in self.longStarts])
+            if self.shared:  # 时间列已经是新数组 文字列也要和快照分开
+                self.texts = list(self.texts)
+                self.words = list(self.words)
+            self.offset = 0
+            self.shared = False
+
+
+class SubtitleStore(object):
+    '''
+    所有字幕轨道 轨道数量不固定
+    每条轨道自己按列保存start/end/text数组 空轨道只是几个空数组 有字幕之后才占内存
+    按轨道序号访问 store[index]
+    '''
+    def __init__(self, trackCount=5):
+        self.tracks = [SubtitleTrack() for _ in range(trackCount)]
+
+    def __len__(self):
+        return len(self.tracks)
+
+    def __getitem__(self, index):
+        return self.tracks[index]
+
+    def items(self):
+        return enumerate(self.tracks)
+
+    def addTrack(self):
+        '''
+        return index of the new empty track
+        '''
+        self.tracks.append(SubtitleTrack())
+        return len(self.tracks) - 1
+
+    def lastEnd(self):
+        return max([track.lastEnd() for track in self.tracks] + [0])
+
+    def commitOffset(self):
+        for track in self.tracks:
+            track.commitOffset()
+
+    def snapshot(self):
+        '''
+        return an O(tracks) copy-on-write snapshot of every track
+        '''
+        store = SubtitleStore(0)
+        store.tracks = [track.snapshot() for track in self.tracks]
+        return store
+
+
+if __name__ == '__main__':
+    # python -m utils.subtitleStore [轮数]  随机操作轨道和快照 与简单列表的结果逐一比对 再给查询计时
+    import sys
+    import time
+    import random
+
+    def randomEvent():
+        start = random.randrange(0, 5000) * 10
+        length = random.randrange(1, 300) * 10 if random.random() < 0.9 else random.randrange(3000, 6000) * 10
+        return start, start + length
+
+    def check(track, model):
+        expected = sorted((start, end, text) for start, (end, text) in model.items())
+        assert list(track) == expected, (list(track), expected)
+        assert track.lastEnd() == max([end for _, end, _ in expected] + [0])
+        for _ in range(5):
+            t = random.randrange(-2000, 110000)
+            events = [event for event in expected if event[1] > t and event[0] < t + 50]
+            assert track.between(t, t + 50) == events
+            assert track.at(t) == ([event for event in expected if event[1] > t and event[0] <= t] or [None])[-1]
+
+    rounds = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    for _ in range(rounds):
+        track = SubtitleTrack()
+        model = {}
+        snapshots = []
+        for step in range(40):
+            op = random.randrange(8)
+            text = 'e%s' % step
+            if op == 0:
+                start, end = randomEvent()
+                track.add(start, end, text)
+                model[start] = (end, text)
+            elif op == 1 and model:
+                start = random.choice(list(model))
+                track.remove(start)
+                del model[start]
+            elif op == 2:
+                delta = random.randrange(-100, 100)
+                track.shift(delta)
+                model = {start + delta: (end + delta, text) for start, (end, text) in model.items()}
+            elif op == 3:
+                track.commitOffset()
+            elif op == 4:
+                snapshots.append((track.snapshot(), dict(model)))
+            elif op == 5:
+                start = random.randrange(-100, 50000)
+                for event in track.removeBetween(start, start + 1000):
+                    del model[event[0]]
+            elif op == 6:
+                events = [randomEvent() + (text, ) for _ in range(random.randrange(1, 6))]
+                track.addMany(events)
+                model.update({start: (end, text) for start, end, text in events})
+            elif op == 7:
+                start = random.randrange(-100, 50000)
+                delta = random.randrange(-3000, 3000)
+                track.shiftBetween(delta, start, start + 5000)
+                moved = {eventStart: event for eventStart, event in model.items() if start <= eventStart < start + 5000}
+                for eventStart in moved:
+                    del model[eventStart]
+                model.update({eventStart + delta: (end + delta, text) for eventStart, (end, text) in sorted(moved.items())})
+            check(track, model)
+            for snapshot, snapshotModel in snapshots:
+                check(snapshot, snapshotModel)
+    print('%s rounds ok' % rounds)
+
+    track = SubtitleTrack((i * 1000, i * 1000 + 800, '字幕%s' % i) for i in range(20000))
+    for name in ('short only', 'one long event'):
+        t = time.perf_counter()
+        for i in range(20000):
+            track.at(i * 1000 + 500)
+        print('%s: at() %.4fms' % (name, (time.perf_counter() - t) / 20))
+        track.add(1, 20000 * 1000, '水印')
@@ -0,0 +1,151 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+
+import os
+import re
+import json
+import hashlib
+import threading
+from array import array
+from bisect import bisect_right
+
+cacheDir = os.path.join('cache', 'thumbnail')
+cacheLimit = 512 * 1024 * 1024  # 缓存目录超过这个大小时删掉最久没用过的
+magic = b'DDKT1\n'
+maxThumbnails = 300  # 每个视频最多存多少张缩略图
+ptsTime = re.compile(r'\[Parsed_showinfo_(\d+) .*?pts_time:\s*(-?[\d.]+)')
+
+
+class ThumbnailStrip(object):
+    '''
+    一个视频的关键帧时间表和缩略图条
+    keyframes: 每个关键帧的时间(ms)
+    times: 每张缩略图的时间(ms) pixels: 所有缩略图的rgb24从上到下拼成的一张竖条
+    '''
+    def __init__(self, keyframes, times, width, height, pixels):
+        self.keyframes = keyframes
+        self.times = times
+        self.width = width
+        self.height = height
+        self.pixels = pixels
+
+    def thumbnail(self, ms):
+        '''
+        return rgb24 bytes of the last thumbnail not after ms, or None
+        '''
+        if not self.times:
+            return None
+        index = max(bisect_right(self.times, ms) - 1, 0)
+        size = self.width * self.height * 3
+        return self.pixels[index * size:(index + 1) * size]
+
+
+def _videoKey(videoPath):
+    '''
+    视频文件太大不读内容 用路径、大小和修改时间算hash
+    '''
+    stat = os.stat(videoPath)
+    text = '%s|%s|%s' % (os.path.abspath(videoPath), stat.st_size, stat.st_mtime_ns)
+    return hashlib.blake2b(text.encode('utf-8'), digest_size=20).hexdigest()
+
+
+def _evict():
+    '''
+    按最近使用(修改)时间从旧到新删除 直到缓存总大小不超过cacheLimit
+    '''
+    entries = []
+    for name in os.listdir(cacheDir):
+        stat = os.stat(os.path.join(cacheDir, name))
+        entries.append((stat.st_mtime, stat.st_size, name))
+    total = sum(entry[1] for entry in entries)
+    for _, size, name in sorted(entries):
+        if total <= cacheLimit:
+            break
+        try:
+            os.remove(os.path.join(cacheDir, name))
+        except OSError:
+            pass
+        total -= size
+
+
+def command(videoPath, duration, width, height):
+    '''
+    receive video path, duration (ms), thumbnail size
+    return ffmpeg cmd 只解关键帧 一遍同时得到关键帧时间和缩略图
+    第一个showinfo记下所有关键帧 select按间隔挑出缩略图 缩小后第二个showinfo记下缩略图的时间
+    '''
+    interval = max(duration / 1000 / maxThumbnails, 1)
+    vf = "showinfo,select='isnan(prev_selected_t)+gte(t-prev_selected_t,%s)',scale=%s:%s,showinfo" % (interval, width, height)
+    return ['utils/ffmpeg.exe', '-hide_banner', '-skip_frame', 'nokey', '-i', videoPath, '-map', '0:v:0',
+            '-vf', vf, '-vsync', '0', '-f', 'rawvideo', '-pix_fmt', 'rgb24', '-']
+
+
+def collect(process, width, height):
+    '''
+    receive ffmpeg process started with command()
+    return ThumbnailStrip, or None if ffmpeg failed or was killed
+    '''
+    keyframes = array('q')
+    times = array('q')
+
+    def readLog():
+        for line in process.stderr:
+            match = ptsTime.search(line.decode('gb18030', 'ignore'))
+            if match:
+                ms = max(int(float(match.group(2)) * 1000), 0)
+                (keyframes if match.group(1) == '0' else times).append(ms)
+
+    reader = threading.Thread(target=readLog, daemon=True)  # stderr和stdout同时读 避免一边写满了卡住ffmpeg
+    reader.start()
+    pixels = process.stdout.read()
+    process.wait()
+    reader.join()
+    if process.returncode != 0 or not keyframes:
+        return None
+    count = min(len(times), len(pixels) // (width * height * 3))
+    return ThumbnailStrip(keyframes, times[:count], width, height, pixels[:count * width * height * 3])
+
+
+def load(videoPath, width, height):
+    '''
+    receive video path and thumbnail size
+    return cached ThumbnailStrip or None
+    '''
+    try:
+        cachePath = os.path.join(cacheDir, _videoKey(videoPath))
+        with open(cachePath, 'rb') as f:
+            data = f.read()
+        if not data.startswith(magic):
+            return None
+        pos = len(magic)
+        headerSize = int.from_bytes(data[pos:pos + 4], 'little')
+        pos += 4
+        header = json.loads(data[pos:pos + headerSize].decode('utf-8'))
+        if header['size'] != [width, height]:
+            return None
+        os.utime(cachePath)  # 修改时间当作最近使用时间
+    except (OSError, ValueError, KeyError):
+        return None
+    return ThumbnailStrip(array('q', header['keyframes']), array('q', header['times']), width, height, data[pos + headerSize:])
+
+
+def save(videoPath, strip):
+    '''
+    magic | json头长度 | json头(尺寸和两张时间表) | 缩略图条
+    缓存写入失败不影响预览
+    '''
+    try:
+        os.makedirs(cacheDir, exist_ok=True)
+        cachePath = os.path.join(cacheDir, _videoKey(videoPath))
+        header = {'size': [strip.width, strip.height], 'keyframes': strip.keyframes.tolist(), 'times': strip.times.tolist()}
+        headerBytes = json.dumps(header).encode('utf-8')
+        tempPath = cachePath + '.tmp'
+        with open(tempPath, 'wb') as f:
+            f.write(magic)
+            f.write(len(headerBytes).to_bytes(4, 'little'))
+            f.write(headerBytes)
+            f.write(strip.pixels)
+        os.replace(tempPath, cachePath)
+        _evict()
+    except OSError:
+        pass
@@ -1,24 +1,13 @@
-import os, time, copy, codecs, subprocess, psutil
+import os, time, subprocess, threading, psutil
+from bisect import bisect_right
+from collections import OrderedDict
 from PySide2.QtWidgets import QGridLayout, QFileDialog, QDialog, QPushButton,\
         QLineEdit, QTableWidget, QTableWidgetItem, QCheckBox, QProgressBar, QLabel,\
         QComboBox, QCheckBox, QWidget, QSlider, QFontDialog, QColorDialog, QTabWidget, QMessageBox
-from PySide2.QtCore import Qt, QTimer, Signal, QThread, QPoint
-from PySide2.QtGui import QFontInfo, QPixmap, QIntValidator
-
-
-def ms2Time(ms):
-    '''
-    receive int
-    return str
-    ms -> h:m:s.ms
-    '''
-    h, m = divmod(ms, 3600000)
-    m, s = divmod(m, 60000)
-    s, ms = divmod(s, 1000)
-    m = ('0%s' % m)[-2:]
-    s = ('0%s' % s)[-2:]
-    ms = ('%s0' % ms)[:2]
-    return '%s:%s:%s.%s' % (h, m, s, ms)
+from PySide2.QtCore import Qt, QTimer, Signal, QThread, QPoint, QCoreApplication
+from PySide2.QtGui import QFontInfo, QPixmap, QIntValidator, QImage
+from utils.subtitleStore import SubtitleStore
+from utils import assWriter, thumbnailCache
 
 
 def calSubTime(t):
@@ -35,12 +24,19 @@ def calSubTime(t):
 
 class Slider(QSlider):
     pointClicked = Signal(QPoint)
+    hovered = Signal(QPoint)  # 鼠标在滑条上移动(不用按下) 显示缩略图
+    left = Signal()
 
     def mousePressEvent(self, event):
         self.pointClicked.emit(event.pos())
 
     def mouseMoveEvent(self, event):
-        self.pointClicked.emit(event.pos())
+        if event.buttons():
+            self.pointClicked.emit(event.pos())
+        self.hovered.emit(event.pos())
+
+    def leaveEvent(self, event):
+        self.left.emit()
 
 
 class videoEncoder(QThread):
@@ -95,6 +91,215 @@ class label(QLabel):
         self.clicked.emit()
 
 
+class previewDecoder(QThread):
+    '''
+    常驻的预览解码线程 界面线程只发请求不等待
+    解码和烧字幕分开: 视频帧按(视频, 秒, 宽, 高)存进LRU缓存 只改字体颜色边距时不用重新解码
+    每次解码请求位置所在的一整段(window秒) 每秒取一帧 再把这一段的原始帧从管道喂给ffmpeg只做ass渲染
+    '''
+    frameReady = Signal(int, QImage)  # 秒, 带字幕的帧
+
+    def __init__(self, window=5, cacheLimit=256 * 1024 * 1024, parent=None):
+        super(previewDecoder, self).__init__(parent)
+        self.window = window
+        self.cacheLimit = cacheLimit  # 原始帧缓存的内存上限(字节)
+        self.condition = threading.Condition()
+        self.pending = None
+        self.key = None  # (videoPath, assVersion, width, height)
+        self.frames = {}  # 秒: 带字幕的QImage 字幕一变就清空
+        self.rawFrames = OrderedDict()  # (videoPath, 秒, width, height): rgb24 bytes
+        self.rawSize = 0
+        self.videoEnds = {}  # videoPath: 解码到的最后一秒+1
+        self.keyframes = []  # 当前视频每个关键帧之后的第一个整秒
+        self.running = True
+
+    def setKeyframes(self, keyframes):
+        '''
+        receive keyframe times (ms) of current video
+        '''
+        self.keyframes = sorted({-(-ms // 1000) for ms in keyframes})
+
+    def windowStart(self, second):
+        '''
+        段开头按window秒对齐 段内有关键帧时从关键帧开始 -ss不用从前一个关键帧一路解过来
+        '''
+        start = second - second % self.window
+        index = bisect_right(self.keyframes, second)
+        if index and self.keyframes[index - 1] > start:
+            return self.keyframes[index - 1]
+        return start
+
+    def cached(self, key, second):
+        with self.condition:
+            if key == self.key:
+                return self.frames.get(second)
+        return None
+
+    def request(self, key, second, assPath):
+        with self.condition:
+            self.pending = (key, second, assPath)
+            self.condition.notify()
+
+    def superseded(self, key, start, sameSource=False):
+        '''
+        界面已经请求了别的段(或别的字幕版本)时 正在做的这一段就不用做完了
+        sameSource: 只看视频和尺寸 字幕版本变了也继续解码 原始帧还能用
+        '''
+        with self.condition:
+            if self.pending is None or not self.running:
+                return not self.running
+            pendingKey, second, _ = self.pending
+            if sameSource:
+                return pendingKey[0] != key[0] or pendingKey[2:] != key[2:] or self.windowStart(second) != start
+            return pendingKey != key or self.windowStart(second) != start
+
+    def stop(self):
+        with self.condition:
+            self.running = False
+            self.condition.notify()
+        self.wait()
+
+    def run(self):
+        while True:
+            with self.condition:
+                while self.pending is None and self.running:
+                    self.condition.wait()
+                if not self.running:
+                    return
+                key, second, assPath = self.pending
+                self.pending = None
+                if key != self.key:
+                    self.key = key
+                    self.frames = {}
+                frame = self.frames.get(second)
+            if frame is not None:
+                self.frameReady.emit(second, frame)
+            else:
+                self.renderWindow(key, second, assPath)
+
+    def cacheRaw(self, rawKey, data):
+        if rawKey in self.rawFrames:
+            self.rawSize -= len(self.rawFrames.pop(rawKey))
+        self.rawFrames[rawKey] = data
+        self.rawSize += len(data)
+        while self.rawSize > self.cacheLimit and len(self.rawFrames) > 1:
+            self.rawSize -= len(self.rawFrames.popitem(last=False)[1])
+
+    def rawWindow(self, key, start):
+        '''
+        return list of rgb24 frames of [start, start + window) 都在缓存里就不解码
+        解码中途被新请求取代时return None
+        '''
+        videoPath, _, width, height = key
+        count = min(self.window, self.videoEnds.get(videoPath, start + self.window) - start)
+        keys = [(videoPath, start + cnt, width, height) for cnt in range(count)]
+        if keys and all(rawKey in self.rawFrames for rawKey in keys):
+            for rawKey in keys:
+                self.rawFrames.move_to_end(rawKey)
+            return [self.rawFrames[rawKey] for rawKey in keys]
+        cmd = ['utils/ffmpeg.exe', '-v', 'error', '-ss', str(start), '-i', videoPath, '-t', str(self.window),
+               '-vf', 'fps=1,scale=%s:%s' % (width, height), '-f', 'rawvideo', '-pix_fmt', 'rgb24', '-']
+        frameSize = width * height * 3
+        p = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+        frames = []
+        try:
+            for cnt in range(self.window):
+                data = p.stdout.read(frameSize)
+                if len(data) < frameSize:
+                    break
+                frames.append(data)
+                self.cacheRaw((videoPath, start + cnt, width, height), data)
+                if self.superseded(key, start, sameSource=True):
+                    return None
+        finally:
+            if p.poll() is None:
+                p.kill()
+            p.stdout.close()
+            p.wait()
+        if len(frames) < self.window:  # 视频最后一段不满window秒 记下结尾 下次也能直接用缓存
+            self.videoEnds[videoPath] = start + len(frames)
+        return frames
+
+    def renderWindow(self, key, second, assPath):
+        width, height = key[2:]
+        start = self.windowStart(second)
+        rawFrames = self.rawWindow(key, start)
+        if not rawFrames or self.superseded(key, start):
+            return
+        # 原始帧按1fps从stdin送进去 第n帧的时间正好是段内第n秒 和预览ass的时间对得上
+        cmd = ['utils/ffmpeg.exe', '-v', 'error', '-f', 'rawvideo', '-pix_fmt', 'rgb24', '-s', '%sx%s' % (width, height), '-r', '1', '-i', '-',
+               '-vf', 'ass=%s' % assPath, '-f', 'rawvideo', '-pix_fmt', 'rgb24', '-']
+        p = subprocess.Popen(cmd, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+        feeder = threading.Thread(target=self.feed, args=(p.stdin, rawFrames), daemon=True)  # 边写边读 管道写满时不会互相等
+        feeder.start()
+        frameSize = width * height * 3
+        try:
+            for cnt in range(len(rawFrames)):
+                data = p.stdout.read(frameSize)
+                if len(data) < frameSize:
+                    break
+                # 每帧的字节直接包成QImage 只在交给界面线程前复制一次 让Qt自己持有像素
+                frame = QImage(data, width, height, width * 3, QImage.Format_RGB888).copy()
+                with self.condition:
+                    if key != self.key:
+                        break
+                    self.frames[start + cnt] = frame
+                self.frameReady.emit(start + cnt, frame)
+        finally:
+            if p.poll() is None:
+                p.kill()
+            p.stdout.close()
+            p.wait()
+            feeder.join()
+
+    def feed(self, stdin, rawFrames):
+        try:
+            for data in rawFrames:
+                stdin.write(data)
+            stdin.close()
+        except OSError:  # ffmpeg已经退出或被kill
+            pass
+
+
+class thumbnailDecoder(QThread):
+    '''
+    后台生成视频的关键帧时间表和缩略图条 只跑一次ffmpeg 按视频缓存在硬盘上 再次打开直接读缓存
+    '''
+    stripReady = Signal(object)  # ThumbnailStrip
+
+    def __init__(self, videoPath, duration, width, height, parent=None):
+        super(thumbnailDecoder, self).__init__(parent)
+        self.videoPath = videoPath
+        self.duration = duration
+        self.width = width
+        self.height = height
+        self.p = None
+        self.stopped = False
+        self.lock = threading.Lock()  # stop()和启动ffmpeg不能交错 否则stop看不到进程 一直等到整遍跑完
+
+    def run(self):
+        strip = thumbnailCache.load(self.videoPath, self.width, self.height)
+        if strip is None:
+            cmd = thumbnailCache.command(self.videoPath, self.duration, self.width, self.height)
+            with self.lock:
+                if self.stopped:
+                    return
+                self.p = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+            strip = thumbnailCache.collect(self.p, self.width, self.height)
+            if strip is None or self.stopped:
+                return
+            thumbnailCache.save(self.videoPath, strip)
+        if not self.stopped:
+            self.stripReady.emit(strip)
+
+    def stop(self):
+        with self.lock:
+            self.stopped = True
+            if self.p is not None and self.p.poll() is None:
+                self.p.kill()
+        self.wait()
+
+
 class encodeOption(QWidget):
     def __init__(self):
         self.anime4KToken = False
@@ -178,6 +383,8 @@ class encodeOption(QWidget):
 
 
 class advanced(QWidget):
+    changed = Signal()
+
     def __init__(self, videoWidth, videoHeight):
         super().__init__()
         layout = QGridLayout()
@@ -222,6 +429,11 @@ class advanced(QWidget):
         self.scaleBS = QComboBox()
         self.scaleBS.addItems(['yes', 'no'])
         layout.addWidget(self.scaleBS, 6, 4, 1, 1)
+        for lineEdit in (self.title, self.originalScript, self.translation, self.editing, self.timing,
+                         self.scriptType, self.playResX, self.playResY, self.timer):
+            lineEdit.textChanged.connect(self.changed)
+        for comboBox in (self.collisions, self.warpStyle, self.scaleBS):
+            comboBox.currentIndexChanged.connect(self.changed)
 
     def setPlayRes(self, videoWidth, videoHeight):
         self.playResX.setText(str(videoWidth))
@@ -229,6 +441,8 @@ class advanced(QWidget):
 
 
 class fontWidget(QWidget):
+    changed = Signal()  # 任意样式改动后发出 用来触发预览
+
     def __init__(self):
         super().__init__()
         self.fontName = '微软雅黑'
@@ -281,6 +495,7 @@ class fontWidget(QWidget):
         self.outlineSizeBox.addItems(['0', '1', '2', '3', '4'])
         self.outlineSizeBox.setCurrentIndex(1)
         self.outlineSizeBox.setFixedWidth(100)
+        self.outlineSizeBox.currentIndexChanged.connect(self.changed)
         self.optionLayout.addWidget(self.outlineSizeBox, 2, 0, 1, 1)
         self.outlineSizeLabel = QLabel('描边大小')
         self.optionLayout.addWidget(self.outlineSizeLabel, 2, 1, 1, 1)
@@ -296,6 +511,7 @@ class fontWidget(QWidget):
         self.shadowSizeBox.addItems(['0', '1', '2', '3', '4'])
         self.shadowSizeBox.setCurrentIndex(1)
         self.shadowSizeBox.setFixedWidth(100)
+        self.shadowSizeBox.currentIndexChanged.connect(self.changed)
         self.optionLayout.addWidget(self.shadowSizeBox, 3, 0, 1, 1)
         self.shadowSizeLabel = QLabel('阴影大小')
         self.optionLayout.addWidget(self.shadowSizeLabel, 3, 1, 1, 1)
@@ -311,6 +527,7 @@ class fontWidget(QWidget):
         self.align.addItems(['1: 左下', '2: 中下', '3: 右下', '4: 中左', '5: 中间', '6: 中右', '7: 左上', '8: 中上', '9: 右上'])
         self.align.setCurrentIndex(1)
         self.align.setFixedWidth(100)
+        self.align.currentIndexChanged.connect(self.changed)
         self.optionLayout.addWidget(self.align, 4, 0, 1, 1)
         self.alignLabel = QLabel('对齐方式')
         self.optionLayout.addWidget(self.alignLabel, 4, 1, 1, 1)
@@ -322,6 +539,7 @@ class fontWidget(QWidget):
         self.VAlignSlider.setValue(10)
         self.optionLayout.addWidget(self.VAlignSlider, 4, 3, 1, 1)
         self.VAlignSlider.setOrientation(Qt.Horizontal)
+        self.VAlignSlider.valueChanged.connect(self.changed)
         self.VAlignLabel = QLabel('垂直边距')
         self.optionLayout.addWidget(self.VAlignLabel, 4, 4, 1, 1)
 
@@ -332,6 +550,7 @@ class fontWidget(QWidget):
         self.LAlignSlider.setTickInterval(20)
         self.optionLayout.addWidget(self.LAlignSlider, 5, 0, 1, 1)
         self.LAlignSlider.setOrientation(Qt.Horizontal)
+        self.LAlignSlider.valueChanged.connect(self.changed)
         self.LAlignLabel = QLabel('左边距')
         self.optionLayout.addWidget(self.LAlignLabel, 5, 1, 1, 1)
         self.RAlignSlider = QSlider()
@@ -341,6 +560,7 @@ class fontWidget(QWidget):
         self.RAlignSlider.setTickInterval(20)
         self.optionLayout.addWidget(self.RAlignSlider, 5, 3, 1, 1)
         self.RAlignSlider.setOrientation(Qt.Horizontal)
+        self.RAlignSlider.valueChanged.connect(self.changed)
         self.RAlignLabel = QLabel('右边距')
         self.optionLayout.addWidget(self.RAlignLabel, 5, 4, 1, 1)
 
@@ -359,6 +579,7 @@ class fontWidget(QWidget):
             fontUnderline = '下划线' if self.fontUnderline else ''
             fontStrikeOut = '删除线' if self.fontStrikeout else ''
             self.fontSelect.setText('%s%s号%s%s%s%s' % (self.fontName, self.fontSize, fontBold, fontItalic, fontUnderline, fontStrikeOut))
+            self.changed.emit()
 
     def setKaraoke(self):
         self.karaokeStatus = not self.karaokeStatus
@@ -370,6 +591,7 @@ class fontWidget(QWidget):
             self.secondColorSelect.hide()
             self.secondColorLabel.hide()
             self.karaoke.setStyleSheet('background-color:#31363b')
+        self.changed.emit()
 
     def getFontColor(self):
         color = QColorDialog.getColor()
@@ -377,6 +599,7 @@ class fontWidget(QWidget):
             self.fontColor = color.name()
             self.fontColorSelect.setText(self.fontColor)
             self.fontColorSelect.setStyleSheet('background-color:%s;color:%s' % (self.fontColor, self.colorReverse(self.fontColor)))
+            self.changed.emit()
 
     def getSecondFontColor(self):
         color = QColorDialog.getColor()
@@ -384,6 +607,7 @@ class fontWidget(QWidget):
             self.secondColor = color.name()
             self.secondColorSelect.setText(self.secondColor)
             self.secondColorSelect.setStyleSheet('background-color:%s;color:%s' % (self.secondColor, self.colorReverse(self.secondColor)))
+            self.changed.emit()
 
     def getOutlineColor(self):
         color = QColorDialog.getColor()
@@ -391,6 +615,7 @@ class fontWidget(QWidget):
             self.outlineColor = color.name()
             self.outlineColorSelect.setText(self.outlineColor)
             self.outlineColorSelect.setStyleSheet('background-color:%s;color:%s' % (self.outlineColor, self.colorReverse(self.outlineColor)))
+            self.changed.emit()
 
     def getShadowColor(self):
         color = QColorDialog.getColor()
@@ -398,6 +623,7 @@ class fontWidget(QWidget):
             self.shadowColor = color.name()
             self.shadowColorSelect.setText(self.shadowColor)
             self.shadowColorSelect.setStyleSheet('background-color:%s;color:%s' % (self.shadowColor, self.colorReverse(self.shadowColor)))
+            self.changed.emit()
 
     def colorReverse(self, color):
         r = 255 - int(color[1:3], 16)
@@ -411,7 +637,7 @@ class VideoDecoder(QDialog):
         self.videoPath = ''
         self.videoWidth = 1920
         self.videoHeight = 1080
-        self.subtitles = {x: {} for x in range(5)}
+        self.subtitles = SubtitleStore(5)
         self.setEncode = encodeOption()
 
         super().__init__()
@@ -433,6 +659,14 @@ class VideoDecoder(QDialog):
         self.previewSlider.setMinimum(0)
         self.previewSlider.setMaximum(1000)
         self.previewSlider.pointClicked.connect(self.setPreviewSlider)
+        self.previewSlider.setMouseTracking(True)
+        self.previewSlider.hovered.connect(self.showThumbnail)
+        self.previewSlider.left.connect(self.hideThumbnail)
+        self.thumbnailLabel = QLabel(self, Qt.ToolTip)  # 悬停时浮在滑条上方的缩略图
+        self.thumbnailLabel.hide()
+        self.thumbnails = None
+        self.thumbnailPath = ''
+        self.thumbnailDecoder = None
         self.layout.addWidget(self.previewSlider, 6, 0, 1, 10)
 
         self.option = QTabWidget()
@@ -440,44 +674,36 @@ class VideoDecoder(QDialog):
         self.layout.addWidget(self.option, 0, 10, 3, 1)
         self.subDict = {x: fontWidget() for x in range(5)}
         for subNumber, tabPage in self.subDict.items():
+            tabPage.changed.connect(self.schedulePreview)
             self.option.addTab(tabPage, '字幕 %s' % (subNumber + 1))
         self.advanced = advanced(self.videoWidth, self.videoHeight)
+        self.advanced.changed.connect(self.schedulePreview)
         self.option.addTab(self.advanced, 'ASS字幕信息')
 
         self.startGrid = QWidget()
         self.layout.addWidget(self.startGrid, 3, 10, 3, 1)
         self.startLayout = QGridLayout()
         self.startGrid.setLayout(self.startLayout)
-        self.sub1Check = QPushButton('字幕 1')
-        self.sub1Check.setStyleSheet('background-color:#3daee9')
-        self.sub2Check = QPushButton('字幕 2')
-        self.sub3Check = QPushButton('字幕 3')
-        self.sub4Check = QPushButton('字幕 4')
-        self.sub5Check = QPushButton('字幕 5')
-        self.sub1CheckStatus = True
-        self.sub2CheckStatus = False
-        self.sub3CheckStatus = False
-        self.sub4CheckStatus = False
-        self.sub5CheckStatus = False
-        self.sub1Check.clicked.connect(self.sub1CheckButtonClick)
-        self.sub2Check.clicked.connect(self.sub2CheckButtonClick)
-        self.sub3Check.clicked.connect(self.sub3CheckButtonClick)
-        self.sub4Check.clicked.connect(self.sub4CheckButtonClick)
-        self.sub5Check.clicked.connect(self.sub5CheckButtonClick)
-        self.startLayout.addWidget(self.sub1Check, 0, 0, 1, 1)
-        self.startLayout.addWidget(self.sub2Check, 0, 1, 1, 1)
-        self.startLayout.addWidget(self.sub3Check, 0, 2, 1, 1)
-        self.startLayout.addWidget(self.sub4Check, 0, 3, 1, 1)
-        self.startLayout.addWidget(self.sub5Check, 0, 4, 1, 1)
+        self.subCheckGrid = QWidget()
+        self.subCheckLayout = QGridLayout()
+        self.subCheckLayout.setContentsMargins(0, 0, 0, 0)
+        self.subCheckGrid.setLayout(self.subCheckLayout)
+        self.startLayout.addWidget(self.subCheckGrid, 0, 0, 1, 5)
+        self.subCheck = []
+        self.subCheckStatus = []
+        self.setTrackCount(len(self.subtitles))
+        self.subCheckButtonClick(0)
         self.layerCheck = QPushButton('禁止字幕重叠')
         self.layerCheck.setStyleSheet('background-color:#3daee9')
         self.layerCheckStatus = True
         self.layerCheck.clicked.connect(self.layerButtonClick)
+        self.layerCheck.clicked.connect(self.schedulePreview)
         self.startLayout.addWidget(self.layerCheck, 1, 0, 1, 2)
         self.encodeSetup = QPushButton('编码设置')
         self.encodeSetup.clicked.connect(self.setEncodeArgs)
         self.startLayout.addWidget(self.encodeSetup, 1, 3, 1, 2)
         self.outputEdit = QLineEdit()
+        self.outputEdit.textChanged.connect(self.schedulePreview)
         self.startLayout.addWidget(self.outputEdit, 2, 0, 1, 4)
         self.outputButton = QPushButton('保存路径')
         self.startLayout.addWidget(self.outputButton, 2, 4, 1, 1)
@@ -501,45 +727,58 @@ class VideoDecoder(QDialog):
         self.videoPos = 1
         self.old_videoPos = 1
         self.duration = 0
-        self.previewTimer = QTimer()
-        self.previewTimer.setInterval(50)
-        self.previewTimer.start()
+        self.previewAss = assWriter.assDocument('temp_preview_sub.ass')  # 预览和压制用的ass分开 压制时预览不会改到压制的字幕
+        self.previewVersion = 0  # 预览ass每重写一次加1 解码线程据此丢弃旧帧
+        self.previewDummy = True  # 样式刚改过时显示示例文字 拖动进度条后显示实际字幕
+        self.previewSecond = -1  # 预览标签上应该显示哪一秒 晚到的旧帧不显示
+        self.previewDecoder = previewDecoder()
+        self.previewDecoder.frameReady.connect(self.showPreviewFrame)
+        self.previewDecoder.start()
+        QCoreApplication.instance().aboutToQuit.connect(self.previewDecoder.stop)
+        QCoreApplication.instance().aboutToQuit.connect(self.stopThumbnails)
+        self.encoding = False
+        self.previewTimer = QTimer()  # 控件改动后重新计时 停下来150ms才渲染一次预览
+        self.previewTimer.setSingleShot(True)
+        self.previewTimer.setInterval(150)
         self.previewTimer.timeout.connect(self.generatePreview)
 
-    def sub1CheckButtonClick(self):
-        self.sub1CheckStatus = not self.sub1CheckStatus
-        if self.sub1CheckStatus:
-            self.sub1Check.setStyleSheet('background-color:#3daee9')
-        else:
-            self.sub1Check.setStyleSheet('background-color:#31363b')
-
-    def sub2CheckButtonClick(self):
-        self.sub2CheckStatus = not self.sub2CheckStatus
-        if self.sub2CheckStatus:
-            self.sub2Check.setStyleSheet('background-color:#3daee9')
-        else:
-            self.sub2Check.setStyleSheet('background-color:#31363b')
-
-    def sub3CheckButtonClick(self):
-        self.sub3CheckStatus = not self.sub3CheckStatus
-        if self.sub3CheckStatus:
-            self.sub3Check.setStyleSheet('background-color:#3daee9')
-        else:
-            self.sub3Check.setStyleSheet('background-color:#31363b')
+    def setTrackCount(self, trackCount):
+        '''
+        轨道数跟随主界面 只补上新增轨道的设置页和选择按钮
+        '''
+        while len(self.subDict) < trackCount:
+            subNumber = len(self.subDict)
+            self.subDict[subNumber] = fontWidget()
+            self.subDict[subNumber].changed.connect(self.schedulePreview)
+            self.option.insertTab(subNumber, self.subDict[subNumber], '字幕 %s' % (subNumber + 1))
+        while len(self.subCheck) < trackCount:
+            subNumber = len(self.subCheck)
+            subCheck = QPushButton('字幕 %s' % (subNumber + 1))
+            subCheck.setStyleSheet('background-color:#31363b')
+            subCheck.clicked.connect(lambda _=False, x=subNumber: self.subCheckButtonClick(x))
+            subCheck.clicked.connect(self.schedulePreview)
+            self.subCheck.append(subCheck)
+            self.subCheckStatus.append(False)
+            self.subCheckLayout.addWidget(subCheck, subNumber // 5, subNumber % 5, 1, 1)
+
+    def schedulePreview(self):
+        '''
+        预览相关的控件改动时调用 一连串改动(拖动滑条、连续输入)只在停下来后渲染一次
+        窗口隐藏或压制中不渲染 显示出来时再补上
+        '''
+        if self.isVisible() and not self.encoding:
+            self.previewTimer.start()
 
-    def sub4CheckButtonClick(self):
-        self.sub4CheckStatus = not self.sub4CheckStatus
-        if self.sub4CheckStatus:
-            self.sub4Check.setStyleSheet('background-color:#3daee9')
-        else:
-            self.sub4Check.setStyleSheet('background-color:#31363b')
+    def showEvent(self, event):
+        super(VideoDecoder, self).showEvent(event)
+        self.schedulePreview()
 
-    def sub5CheckButtonClick(self):
-        self.sub5CheckStatus = not self.sub5CheckStatus
-        if self.sub5CheckStatus:
-            self.sub5Check.setStyleSheet('background-color:#3daee9')
+    def subCheckButtonClick(self, subNumber):
+        self.subCheckStatus[subNumber] = not self.subCheckStatus[subNumber]
+        if self.subCheckStatus[subNumber]:
+            self.subCheck[subNumber].setStyleSheet('background-color:#3daee9')
         else:
-            self.sub5Check.setStyleSheet('background-color:#31363b')
+            self.subCheck[subNumber].setStyleSheet('background-color:#31363b')
 
     def layerButtonClick(self):
         self.layerCheckStatus = not self.layerCheckStatus
@@ -563,10 +802,54 @@ class VideoDecoder(QDialog):
         self.setEncode.exportVideoFPS.setText(str(fps))
         self.duration = duration
         self.advanced.setPlayRes(videoWidth, videoHeight)
-        self.subtitles = copy.deepcopy(subtitles)
-        for index in self.subtitles:
-            if -1 in self.subtitles[index]:
-                del self.subtitles[index][-1]
+        self.subtitles = subtitles.snapshot()  # 主界面之后的修改不影响预览和压制
+        self.setTrackCount(len(self.subtitles))
+        if videoPath != self.thumbnailPath:
+            self.loadThumbnails()
+        self.schedulePreview()
+
+    def loadThumbnails(self):
+        '''
+        换了视频时重新取缩略图条和关键帧 拿到之前预览照常按对齐的段解码
+        '''
+        self.stopThumbnails()
+        self.thumbnailPath = self.videoPath
+        self.thumbnails = None
+        self.previewDecoder.setKeyframes([])
+        if not self.videoPath or not self.videoWidth:
+            return
+        width = 160
+        height = max(width * self.videoHeight // self.videoWidth // 2 * 2, 2)
+        self.thumbnailDecoder = thumbnailDecoder(self.videoPath, self.duration, width, height)
+        self.thumbnailDecoder.stripReady.connect(self.setThumbnails)
+        self.thumbnailDecoder.start()
+
+    def stopThumbnails(self):
+        if self.thumbnailDecoder is not None:
+            self.thumbnailDecoder.stop()
+            self.thumbnailDecoder = None
+
+    def setThumbnails(self, strip):
+        if self.sender() is not self.thumbnailDecoder:  # 已经换了视频 旧线程的结果不要
+            return
+        self.thumbnails = strip
+        self.previewDecoder.setKeyframes(strip.keyframes)
+
+    def showThumbnail(self, p):
+        if not self.thumbnails or not self.duration:
+            return
+        ms = min(max(p.x() / self.previewSlider.width(), 0), 1) * self.duration
+        data = self.thumbnails.thumbnail(ms)
+        if data is None:
+            return
+        width, height = self.thumbnails.width, self.thumbnails.height
+        self.thumbnailLabel.setPixmap(QPixmap.fromImage(QImage(data, width, height, width * 3, QImage.Format_RGB888)))
+        self.thumbnailLabel.resize(width, height)
+        self.thumbnailLabel.move(self.previewSlider.mapToGlobal(QPoint(p.x() - width // 2, -height - 10)))
+        self.thumbnailLabel.show()
+
+    def hideThumbnail(self):
+        self.thumbnailLabel.hide()
 
     def setSubDictStyle(self, assSummary):
         subNumber = assSummary[0]
@@ -581,13 +864,14 @@ class VideoDecoder(QDialog):
         secondColor = self.rgbColor(assDict['SecondaryColour'])
         outlineColor = self.rgbColor(assDict['OutlineColour'])
         shadowColor = self.rgbColor(assDict['BackColour'])
-        outline = int(assDict['Outline'])
-        shadow = int(assDict['Shadow'])
-        alignment = int(assDict['Alignment']) - 1
-        VA = int(assDict['MarginV'])
-        LA = int(assDict['MarginL'])
-        RA = int(assDict['MarginR'])
-
+        outline = int(float(assDict['Outline']))
+        shadow = int(float(assDict['Shadow']))
+        alignment = int(float(assDict['Alignment'])) - 1
+        VA = int(float(assDict['MarginV']))
+        LA = int(float(assDict['MarginL']))
+        RA = int(float(assDict['MarginR']))
+
+        self.setTrackCount(subNumber + 1)
         tabPage = self.subDict[subNumber]
         tabPage.fontName = fontName
         tabPage.fontSize = fontSize
@@ -620,6 +904,7 @@ class VideoDecoder(QDialog):
         tabPage.VAlignSlider.setValue(VA * 100 // self.videoHeight)
         tabPage.LAlignSlider.setValue(LA * 100 // self.videoWidth)
         tabPage.RAlignSlider.setValue(RA * 100 // self.videoWidth) 
+        self.schedulePreview()
 
     def setPreviewSlider(self, p):
         pos = p.x() / self.previewSlider.width() * 1000
@@ -629,6 +914,7 @@ class VideoDecoder(QDialog):
             pos = 0
         self.previewSlider.setValue(pos)
         self.videoPos = pos * self.duration // 1000000
+        self.schedulePreview()
 
     def ffmpegColor(self, color):
         '''
@@ -662,7 +948,7 @@ class VideoDecoder(QDialog):
                            self.advanced.collisions.currentText(), self.advanced.playResX.text(), self.advanced.playResY.text(),
                            self.advanced.timer.text(), self.advanced.warpStyle.currentText().split(':')[0], self.advanced.scaleBS.currentText()]]
         self.selectedSubDict = {}
-        for subNumber, subCheck in enumerate([self.sub1CheckStatus, self.sub2CheckStatus, self.sub3CheckStatus, self.sub4CheckStatus, self.sub5CheckStatus]):
+        for subNumber, subCheck in enumerate(self.subCheckStatus):
             if subCheck:
                 self.selectedSubDict[subNumber] = self.subDict[subNumber]
         self.subtitleArgs = {}
@@ -694,107 +980,77 @@ class VideoDecoder(QDialog):
             self.writeAss(subtitlePath, False, True)
             QMessageBox.information(self, '导出字幕', '导出完成', QMessageBox.Yes)
 
-    def writeAss(self, outputPath='temp_sub.ass', preview=True, tip=False, pos=0):
-        ass = codecs.open(outputPath, 'w', 'utf_8_sig')
-        ass.write('[Script Info]\n')
-        ass.write('Title: %s\n' % self.advanced.title.text())
-        ass.write('OriginalScript: %s\n' % self.advanced.originalScript.text())
-        ass.write('OriginalTranslation: %s\n' % self.advanced.translation.text())
-        ass.write('OriginalEditing: %s\n' % self.advanced.editing.text())
-        ass.write('OriginalTiming: %s\n' % self.advanced.timing.text())
-        ass.write('ScriptType: %s\n' % self.advanced.scriptType.text())
-        ass.write('Collisions: %s\n' % self.advanced.collisions.currentText())
-        ass.write('PlayResX: %s\n' % self.advanced.playResX.text())
-        ass.write('PlayResY: %s\n' % self.advanced.playResY.text())
-        ass.write('Timer: %s\n' % self.advanced.timer.text())
-        ass.write('WrapStyle: %s\n' % self.advanced.warpStyle.currentText().split(':')[0])
-        ass.write('ScaledBorderAndShadow: %s\n\n' % self.advanced.scaleBS.currentText())
-
-        ass.write('[V4+ Styles]\n')
-        ass.write('Format: Name, Fontname, Fontsize, PrimaryColour, SecondaryColour, OutlineColour, BackColour, Bold, Italic, Underline, StrikeOut, ')
-        ass.write('ScaleX, ScaleY, Spacing, Angle, BorderStyle, Outline, Shadow, Alignment, MarginL, MarginR, MarginV, Encoding\n')
-        for subNumber, fontArgs in self.subtitleArgs.items():
-            style = 'Style: Subtitle_%s' % (subNumber + 1)
-            for i in fontArgs:
-                style += ',%s' % i
-            ass.write('%s\n\n' % style)
-
-        ass.write('[Events]\n')
-        ass.write('Format: Layer, Start, End, Style, Name, MarginL, MarginR, MarginV, Effect, Text\n')
-        if preview:
-            for subNumber in self.subtitleArgs:
-                num = subNumber + 1
-                if self.karaokDict[subNumber][0]:
-                    karaX = self.karaokDict[subNumber][2]
-                    karaY = self.karaokDict[subNumber][3]
-                    if self.layerCheckStatus:
-                        line = 'Dialogue: 0,0:00:00.00,0:00:10.00,%s,#%s,0,0,0,,{\\K10\\move(%s,%s,%s,%s)}%s\n' % \
-                        ('Subtitle_%s' % num, num, karaX, karaY, karaX + 100, karaY, r'Hi! 我是第%s列歌词。' % num)
-                    else:
-                        line = 'Dialogue: %s,0:00:00.00,0:00:10.00,%s,#%s,0,0,0,,{\\K10\\move(%s,%s,%s,%s)}%s\n' % \
-                        (subNumber, 'Subtitle_%s' % num, num, karaX, karaY, karaX + 100, karaY, 'Hi! 我是第%s列歌词。' % num)
-                    ass.write(line)
-                else:
-                    if self.layerCheckStatus:
-                        line = 'Dialogue: 0,0:00:00.00,0:00:10.00,%s,#%s,0,0,0,,%s\n' % \
-                        ('Subtitle_%s' % num, num, r'Hi! 我是第%s列字幕。' % num)
-                    else:
-                        line = 'Dialogue: %s,0:00:00.00,0:00:10.00,%s,#%s,0,0,0,,%s\n' % \
-                        (subNumber, 'Subtitle_%s' % num, num, 'Hi! 我是第%s列字幕。' % num)
-                    ass.write(line)
-            if tip:
-                QMessageBox.information(self, '导出字幕', '导出完成', QMessageBox.Yes)
-        else:
-            if not pos:
-                for subNumber in self.subtitleArgs:
-                    for start, subData in self.subtitles[subNumber].items():
-                        if subData[1]:
-                            num = subNumber + 1
-                            if self.karaokDict[subNumber][0]:
-                                karaX = self.karaokDict[subNumber][2]
-                                karaY = self.karaokDict[subNumber][3]
-                                if self.layerCheckStatus:
-                                    line = 'Dialogue: 0,%s,%s,%s,#%s,0,0,0,,{\\K%s\\move(%s,%s,%s,%s)\\fad(500,500)}%s\n' % \
-                                    (ms2Time(start), ms2Time(start + subData[0]), 'Subtitle_%s' % num, num, subData[0] // 10 - 100, karaX, karaY, karaX + 100, karaY, subData[1])
-                                else:
-                                    line = 'Dialogue: %s,%s,%s,%s,#%s,0,0,0,,{\\K%s\\move(%s,%s,%s,%s)\\fad(500,500)}%s\n' % \
-                                    (subNumber, ms2Time(start), ms2Time(start + subData[0]), 'Subtitle_%s' % num, num, subData[0] // 10 - 100, karaX, karaY, karaX + 100, karaY, subData[1])
-                                ass.write(line)
-                            else:
-                                if self.layerCheckStatus:
-                                    line = 'Dialogue: 0,%s,%s,%s,#%s,0,0,0,,%s\n' % (ms2Time(start), ms2Time(start + subData[0]), 'Subtitle_%s' % num, num, subData[1])
-                                else:
-                                    line = 'Dialogue: %s,%s,%s,%s,#%s,0,0,0,,%s\n' % (subNumber, ms2Time(start), ms2Time(start + subData[0]), 'Subtitle_%s' % num, num, subData[1])
-                                ass.write(line)
+    def scriptInfo(self):
+        return [('Title', self.advanced.title.text()), ('OriginalScript', self.advanced.originalScript.text()),
+                ('OriginalTranslation', self.advanced.translation.text()), ('OriginalEditing', self.advanced.editing.text()),
+                ('OriginalTiming', self.advanced.timing.text()), ('ScriptType', self.advanced.scriptType.text()),
+                ('Collisions', self.advanced.collisions.currentText()), ('PlayResX', self.advanced.playResX.text()),
+                ('PlayResY', self.advanced.playResY.text()), ('Timer', self.advanced.timer.text()),
+                ('WrapStyle', self.advanced.warpStyle.currentText().split(':')[0]),
+                ('ScaledBorderAndShadow', self.advanced.scaleBS.currentText())]
+
+    def eventLines(self, preview=True):
+        '''
+        preview: 每条轨道一句示例文字
+        否则导出全部字幕
+        '''
+        lines = []
+        for subNumber in self.subtitleArgs:
+            layer = 0 if self.layerCheckStatus else subNumber
+            karaoke = self.karaokDict[subNumber][2:] if self.karaokDict[subNumber][0] else None
+            if preview:
+                text = 'Hi! 我是第%s列歌词。' if karaoke else 'Hi! 我是第%s列字幕。'
+                lines.append(assWriter.stillLine(text % (subNumber + 1), subNumber, layer, karaoke))
             else:
-                for subNumber in self.subtitleArgs:
-                    startKeys = list(self.subtitles[subNumber].keys())
-                    for cnt, start in enumerate(startKeys):
-                        if start / 1000 > pos and cnt:
-                            start = startKeys[cnt - 1]
-                            subData = self.subtitles[subNumber][start]
-                            num = subNumber + 1
-                            if self.karaokDict[subNumber][0]:
-                                karaX = self.karaokDict[subNumber][2]
-                                karaY = self.karaokDict[subNumber][3]
-                                if self.layerCheckStatus:
-                                    line = 'Dialogue: 0,0:00:00.00,0:00:10.00,%s,#%s,0,0,0,,{\\K1000\\move(%s,%s,%s,%s)}%s\n' % \
-                                    ('Subtitle_%s' % num, num, karaX, karaY, karaX + 100, karaY, subData[1])
-                                else:
-                                    line = 'Dialogue: %s,0:00:00.00,0:00:10.00,%s,#%s,0,0,0,,{\\K1000\\move(%s,%s,%s,%s)}%s\n' % \
-                                    (subNumber, 'Subtitle_%s' % num, num, karaX, karaY, karaX + 100, karaY, subData[1])
-                                ass.write(line)
-                                break
-                            else:
-                                if self.layerCheckStatus:
-                                    line = 'Dialogue: 0,0:00:00.00,0:00:10.00,%s,#%s,0,0,0,,%s\n' % \
-                                    ('Subtitle_%s' % num, num, subData[1])
-                                else:
-                                    line = 'Dialogue: %s,0:00:00.00,0:00:10.00,%s,#%s,0,0,0,,%s\n' % \
-                                    (subNumber, 'Subtitle_%s' % num, num, subData[1])
-                                ass.write(line)
-                                break
-        ass.close()
+                lines += assWriter.dialogueLines(self.subtitles[subNumber].withWords(), subNumber, layer, karaoke)
+        return lines
+
+    def writeAss(self, outputPath='temp_sub.ass', preview=True, tip=False):
+        assWriter.writeAss(outputPath, assWriter.headerText(self.scriptInfo(), self.subtitleArgs), self.eventLines(preview))
+        if preview and tip:
+            QMessageBox.information(self, '导出字幕', '导出完成', QMessageBox.Yes)
+
+    def windowLines(self, start, end, preview=True):
+        '''
+        预览段[start, end)秒内的字幕 时间改为相对段开头 配合ffmpeg的-ss
+        preview: 整段都显示每条轨道的示例文字
+        '''
+        lines = []
+        startMs, endMs = start * 1000, end * 1000
+        for subNumber in self.subtitleArgs:
+            layer = 0 if self.layerCheckStatus else subNumber
+            karaoke = self.karaokDict[subNumber][2:] if self.karaokDict[subNumber][0] else None
+            if preview:
+                text = 'Hi! 我是第%s列歌词。' if karaoke else 'Hi! 我是第%s列字幕。'
+                events = [(0, endMs - startMs, text % (subNumber + 1), None)]
+            else:
+                track = self.subtitles[subNumber]
+                events = [(max(eventStart - startMs, 0), eventEnd - startMs, text, None) for eventStart, eventEnd, text in track.between(startMs, endMs)]
+            lines += assWriter.dialogueLines(events, subNumber, layer, karaoke)
+        return lines
+
+    def updatePreviewAss(self, lines):
+        '''
+        预览只更新内存里的ass 内容真的变了才写文件
+        '''
+        self.previewAss.setScriptInfo(self.scriptInfo())
+        self.previewAss.setStyles(self.subtitleArgs)
+        self.previewAss.setEvents(lines)
+        if self.previewAss.flush():
+            self.previewVersion += 1
+
+    def previewSize(self):
+        '''
+        按输出分辨率的比例 宽度不超过1280 宽高取偶数
+        '''
+        try:
+            width = int(self.setEncode.exportVideoWidth.text())
+            height = int(self.setEncode.exportVideoHeight.text())
+        except ValueError:
+            width, height = self.videoWidth, self.videoHeight
+        if width > 1280:
+            width, height = 1280, height * 1280 // width
+        return max(width // 2 * 2, 2), max(height // 2 * 2, 2)
 
     def generatePreview(self, force=False):
         self.collectArgs()
@@ -807,32 +1063,36 @@ class VideoDecoder(QDialog):
         else:
             self.startButton.setEnabled(True)
         if self.decodeArgs != self.old_decodeArgs or self.videoPos != self.old_videoPos or force:
-            if os.path.exists('temp_sub.jpg'):
-                os.remove('temp_sub.jpg')
             if self.decodeArgs != self.old_decodeArgs:
                 self.old_decodeArgs = self.decodeArgs
-                self.writeAss()
+                self.previewDummy = True
             elif self.videoPos != self.old_videoPos:
                 self.old_videoPos = self.videoPos
-                self.writeAss(preview=False, pos=self.videoPos)
-            else:
-                self.writeAss()
-            videoWidth = self.setEncode.exportVideoWidth.text()
-            videoHeight = self.setEncode.exportVideoHeight.text()
-            bit = self.setEncode.exportVideoBitrate.text() + 'k'
-            preset = ['veryslow', 'slow', 'medium', 'fast', 'ultrafast'][self.setEncode.exportVideoPreset.currentIndex()]
-            cmd = ['utils/ffmpeg.exe', '-y', '-ss', str(self.videoPos), '-i', self.videoPath, '-frames', '1', '-vf', 'ass=temp_sub.ass',
-                   '-s', '%sx%s' % (videoWidth, videoHeight), '-b:v', bit, '-preset', preset, '-q:v', '1', '-f', 'image2', 'temp_sub.jpg']
+                self.previewDummy = False
             if not self.videoPath:
                 self.preview.setText('请先在主界面选择视频')
                 self.preview.setStyleSheet("QLabel{background:white;color:#232629}")
-            else:
-                p = subprocess.Popen(cmd)
-                p.wait()
-                pixmap = QPixmap('temp_sub.jpg')
-                self.preview.setPixmap(pixmap)
+                return
+            self.requestPreview(int(self.videoPos), self.previewDummy)
+
+    def requestPreview(self, second, preview=False):
+        '''
+        已经渲染过的帧直接显示 否则交给previewDecoder 画面经管道以rgb24送回 不落地成图片
+        '''
+        self.previewSecond = second
+        start = self.previewDecoder.windowStart(second)
+        self.updatePreviewAss(self.windowLines(start, start + self.previewDecoder.window, preview))
+        width, height = self.previewSize()
+        key = (self.videoPath, self.previewVersion, width, height)
+        frame = self.previewDecoder.cached(key, second)
+        if frame is not None:
+            self.showPreviewFrame(second, frame)
         else:
-            pass
+            self.previewDecoder.request(key, second, self.previewAss.outputPath)
+
+    def showPreviewFrame(self, second, frame):
+        if second == self.previewSecond:
+            self.preview.setPixmap(QPixmap.fromImage(frame))
 
     def setEncodeArgs(self):
         self.setEncode.hide()
@@ -857,6 +1117,7 @@ class VideoDecoder(QDialog):
             if os.path.exists('temp_sub.ass'):
                 os.remove('temp_sub.ass')
             self.previewTimer.stop()
+            self.encoding = True
             self.collectArgs()
             self.writeAss(preview=False)
     
@@ -899,24 +1160,18 @@ class VideoDecoder(QDialog):
         self.previewSlider.setValue(value * 10)
 
     def setEncodePreview(self, currentPos):
-        self.writeAss(preview=False, pos=calSubTime(currentPos))
-        cmd = ['utils/ffmpeg.exe', '-y', '-ss', currentPos, '-i', self.videoPath, '-frames', '1', '-vf', 'ass=temp_sub.ass', '-q:v', '1', '-f', 'image2', 'temp_sub.jpg']
-        p = subprocess.Popen(cmd)
-        p.wait()
-        pixmap = QPixmap('temp_sub.jpg')
-        self.preview.setPixmap(pixmap)
+        self.requestPreview(calSubTime(currentPos))
 
     def encodeFinish(self, result):
         self.startButton.setText('开始合成')
         self.startButton.setStyleSheet('background-color:#31363b')
         self.startButton.clicked.disconnect(self.terminateEncode)
         self.startButton.clicked.connect(self.exportVideo)
+        self.encoding = False
         if result:
-            self.previewTimer.start()
             self.processBar.setValue(100)
             QMessageBox.information(self, '导出视频', '导出完成', QMessageBox.Yes)
         else:
-            self.previewTimer.start()
             self.processBar.setValue(0)
             QMessageBox.information(self, '导出视频', '导出视频失败！请检查参数或编码器是否选择正确', QMessageBox.Yes)
         self.generatePreview(force=True)
@@ -938,6 +1193,6 @@ class VideoDecoder(QDialog):
         self.videoEncoder.wait()
         del self.videoEncoder
         self.processBar.setValue(0)
+        self.encoding = False
         QMessageBox.information(self, '导出视频', '中止导出', QMessageBox.Yes)
         self.generatePreview(force=True)
-        self.previewTimer.start()